@@ -1,72 +1,145 @@
 # config.py
 import os
+import copy
 import json
+import shutil
 import logging
+import tempfile
+import functools
 from pathlib import Path
+from types import MappingProxyType
+
+try:
+    import orjson
+except ImportError:  # optional, stdlib json is used as a fallback
+    orjson = None
 
 logger = logging.getLogger(__name__)
 
+# Read-only defaults shared by every Config; use _copy_defaults() for a mutable copy
+_DEFAULT_CONFIG = MappingProxyType({
+    # API configuration
+    'api': MappingProxyType({
+        'api_key': '',
+        'api_secret': '',
+        'access_token': ''
+    }),
+    # Breakout strategy parameters
+    'breakout_strategy': MappingProxyType({
+        'lookback_days': 125,
+        'volume_ratio_threshold': 1.0,
+        'rsi_threshold': 70,
+        'position_size_pct': 0.1,
+        'take_profit_pct': 3.0,
+        'stop_loss_pct': 3.0
+    }),
+    # Breakdown strategy parameters
+    'breakdown_strategy': MappingProxyType({
+        'lookback_days': 125,
+        'volume_ratio_threshold': 1.0,
+        'rsi_threshold': 30,
+        'position_size_pct': 1.0,
+        'take_profit_pct': 3.0,
+        'stop_loss_pct': 3.0
+    }),
+    # General settings
+    'general': MappingProxyType({
+        'max_positions': 10,
+        'scan_interval_minutes': 5,
+        'enable_email_notifications': False,
+        'auto_close_at_market_close': True
+    }),
+    # Email notification settings
+    'notifications': MappingProxyType({
+        'email': '',
+        'smtp_server': '',
+        'smtp_port': 587,
+        'smtp_username': '',
+        'smtp_password': ''
+    })
+})
+
+
+def _copy_defaults():
+    """Return a mutable copy of the default config"""
+    return {section: dict(values) for section, values in _DEFAULT_CONFIG.items()}
+
+
+def _read_json(path):
+    """Parse a JSON file, with orjson when available"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _write_json(path, config):
+    """Atomically serialize config to a JSON file, with orjson when available"""
+    if orjson is not None:
+        data = orjson.dumps(config, option=orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE)
+    else:
+        data = (json.dumps(config, indent=2) + "\n").encode()
+    # Write to a uniquely named temp file and swap it in so readers never see a
+    # partial file and the bot and dashboard never write the same temp file
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix=f"{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        # The file holds credentials, so keep whatever mode it already had
+        if os.path.exists(path):
+            shutil.copymode(path, tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+@functools.lru_cache(maxsize=16)
+def _parse_config(path, mtime_ns):
+    """Parse a config file once per mtime; a save or edit changes the mtime and the cache key"""
+    return _read_json(path)
+
+
+def _load_cached(path, mtime_ns):
+    """Return a private copy of the parsed config for this mtime"""
+    return copy.deepcopy(_parse_config(path, mtime_ns))
+
+
 class Config:
+    __slots__ = ("config_path", "default_config", "config", "_flat", "_dirty")
+    
     def __init__(self, config_path='config.json'):
         self.config_path = config_path
-        self.default_config = {
-            # API configuration
-            'api': {
-                'api_key': '',
-                'api_secret': '',
-                'access_token': ''
-            },
-            # Breakout strategy parameters
-            'breakout_strategy': {
-                'lookback_days': 125,
-                'volume_ratio_threshold': 1.0,
-                'rsi_threshold': 70,
-                'position_size_pct': 0.1,
-                'take_profit_pct': 3.0,
-                'stop_loss_pct': 3.0
-            },
-            # Breakdown strategy parameters
-            'breakdown_strategy': {
-                'lookback_days': 125,
-                'volume_ratio_threshold': 1.0,
-                'rsi_threshold': 30,
-                'position_size_pct': 1.0,
-                'take_profit_pct': 3.0,
-                'stop_loss_pct': 3.0
-            },
-            # General settings
-            'general': {
-                'max_positions': 10,
-                'scan_interval_minutes': 5,
-                'enable_email_notifications': False,
-                'auto_close_at_market_close': True
-            },
-            # Email notification settings
-            'notifications': {
-                'email': '',
-                'smtp_server': '',
-                'smtp_port': 587,
-                'smtp_username': '',
-                'smtp_password': ''
-            }
-        }
+        self.default_config = _DEFAULT_CONFIG
+        self._dirty = False
         self.config = self.load_config()
+        self._rebuild_flat()
+    
+    def _rebuild_flat(self):
+        """Index config values by (section, key) for single-lookup reads"""
+        self._flat = {
+            (section, key): value
+            for section, values in self.config.items() if isinstance(values, dict)
+            for key, value in values.items()
+        }
     
     def load_config(self):
         """Load config from file or create default if not exists"""
         try:
             if os.path.exists(self.config_path):
-                with open(self.config_path, 'r') as f:
-                    config = json.load(f)
-                    logger.info(f"Configuration loaded from {self.config_path}")
-                    return config
+                mtime_ns = os.stat(self.config_path).st_mtime_ns
+                config = _load_cached(self.config_path, mtime_ns)
+                logger.info(f"Configuration loaded from {self.config_path}")
+                return config
             else:
                 logger.info(f"No configuration file found at {self.config_path}. Creating default.")
-                self.save_config(self.default_config)
-                return self.default_config
+                config = _copy_defaults()
+                self.save_config(config)
+                return config
         except Exception as e:
             logger.error(f"Error loading configuration: {e}")
-            return self.default_config
+            return _copy_defaults()
     
     def save_config(self, config=None):
         """Save config to file"""
@@ -74,8 +147,7 @@ class Config:
             if config is None:
                 config = self.config
             
-            with open(self.config_path, 'w') as f:
-                json.dump(config, f, indent=4)
+            _write_json(self.config_path, config)
             
             logger.info(f"Configuration saved to {self.config_path}")
             return True
@@ -83,12 +155,22 @@ class Config:
             logger.error(f"Error saving configuration: {e}")
             return False
     
+    def flush(self):
+        """Write buffered config updates to disk"""
+        if not self._dirty:
+            return True
+        if self.save_config():
+            self._dirty = False
+            return True
+        return False
+    
     def update_config(self, section, key, value):
-        """Update a specific config value"""
+        """Update a specific config value in memory; call flush() to persist"""
         try:
             if section in self.config and key in self.config[section]:
                 self.config[section][key] = value
-                self.save_config()
+                self._flat[(section, key)] = value
+                self._dirty = True
                 logger.info(f"Updated config: {section}.{key} = {value}")
                 return True
             else:
@@ -100,14 +182,7 @@ class Config:
     
     def get_value(self, section, key, default=None):
         """Get a specific config value"""
-        try:
-            if section in self.config and key in self.config[section]:
-                return self.config[section][key]
-            else:
-                return default
-        except Exception as e:
-            logger.error(f"Error getting configuration value: {e}")
-            return default
+        return self._flat.get((section, key), default)
     
     def get_section(self, section):
         """Get an entire config section"""
@@ -1,13 +1,13 @@
 # dashboard.py
 import os
-import time
 import streamlit as st
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
-import plotly.express as px
 from datetime import datetime, timedelta
 
 from kiteconnect import KiteConnect
+from config import Config
 from database import Database
 
 # Initialize Zerodha API with environment variables
@@ -15,14 +15,26 @@ API_KEY = os.environ.get("ZERODHA_API_KEY", "your_api_key")
 API_SECRET = os.environ.get("ZERODHA_API_SECRET", "your_api_secret")
 ACCESS_TOKEN = os.environ.get("ZERODHA_ACCESS_TOKEN")
 
-# Initialize database
-db = Database('trades.db')
+# Initialize database and configuration. Streamlit runs every rerun and
+# fragment run on a new thread, so the cached Database shares one connection
+# across them instead of opening a new one per thread.
+@st.cache_resource(show_spinner=False)
+def get_db(db_path):
+    return Database(db_path, shared=True)
 
-# Initialize Kite Connect if access token is available
-kite = None
-if ACCESS_TOKEN:
-    kite = KiteConnect(api_key=API_KEY)
-    kite.set_access_token(ACCESS_TOKEN)
+db = get_db('trades.db')
+config = Config()
+
+# Initialize Kite Connect if access token is available. The client is cached
+# across reruns so its HTTP session keeps connections to the API alive.
+# No spinner, since this runs before st.set_page_config.
+@st.cache_resource(show_spinner=False)
+def get_kite(api_key, access_token):
+    k = KiteConnect(api_key=api_key)
+    k.set_access_token(access_token)
+    return k
+
+kite = get_kite(API_KEY, ACCESS_TOKEN) if ACCESS_TOKEN else None
 
 # Page configuration
 st.set_page_config(
@@ -74,6 +86,43 @@ with st.sidebar.expander("Authentication", expanded=not ACCESS_TOKEN):
     else:
         st.success("Authenticated with Zerodha")
 
+# Cached API/DB reads, keyed on hashable args; the Kite client is passed as
+# an underscore-prefixed arg so Streamlit does not try to hash it
+@st.cache_data(ttl=30)
+def _fetch_account(_kite, access_token):
+    profile = _kite.profile()
+    margins = _kite.margins()
+    positions = _kite.positions()
+    
+    open_positions = sum(1 for p in positions.get("net", ()) if p["quantity"])
+    
+    return {
+        "user_id": profile["user_id"],
+        "user_name": profile["user_name"],
+        "available_cash": margins["equity"]["available"]["cash"],
+        "used_margin": margins["equity"]["utilised"]["debits"],
+        "open_positions": open_positions
+    }
+
+# symbols must be a sorted tuple of unique keys so permutations share an entry
+@st.cache_data(ttl=2)
+def _fetch_ltp(_kite, symbols):
+    return _kite.ltp(list(symbols))
+
+@st.cache_data(ttl=300)
+def _fetch_daily_summaries(days):
+    return db.get_daily_summaries(days=days)
+
+@st.cache_data(ttl=300)
+def _fetch_performance_totals(days):
+    return db.get_performance_totals(days=days)
+
+if st.sidebar.button("Refresh"):
+    _fetch_account.clear()
+    _fetch_ltp.clear()
+    _fetch_daily_summaries.clear()
+    _fetch_performance_totals.clear()
+
 # Function to fetch account details
 def get_account_details():
     if not kite:
@@ -86,19 +135,7 @@ def get_account_details():
         }
     
     try:
-        profile = kite.profile()
-        margins = kite.margins()
-        positions = kite.positions()
-        
-        open_positions = len([p for p in positions.get("net", []) if p["quantity"] != 0])
-        
-        return {
-            "user_id": profile["user_id"],
-            "user_name": profile["user_name"],
-            "available_cash": margins["equity"]["available"]["cash"],
-            "used_margin": margins["equity"]["utilised"]["debits"],
-            "open_positions": open_positions
-        }
+        return _fetch_account(kite, ACCESS_TOKEN)
     except Exception as e:
         st.error(f"Error fetching account details: {e}")
         return {
@@ -123,6 +160,22 @@ def exit_trade(trade_id):
             st.error(f"Trade {trade_id} not found")
             return False
         
+        # The trader may have exited it since the page was drawn
+        if trade['status'] != "OPEN":
+            st.warning(f"Trade {trade_id} is already {trade['status']}")
+            return False
+        
+        # Get current price (cached for a couple of seconds) before the order,
+        # so a failed quote never leaves an exit order without its database update
+        symbol_key = f"NSE:{trade['symbol']}"
+        ltp_data = _fetch_ltp(kite, (symbol_key,))
+        
+        if symbol_key not in ltp_data:
+            st.error(f"No price data for {trade['symbol']}")
+            return False
+        
+        current_price = ltp_data[symbol_key]["last_price"]
+        
         # Determine exit transaction type (opposite of entry)
         exit_type = "SELL" if trade['trade_type'] == "BUY" else "BUY"
         
@@ -138,10 +191,6 @@ def exit_trade(trade_id):
             price=None
         )
         
-        # Get current price
-        ltp = kite.ltp(f"NSE:{trade['symbol']}")
-        current_price = ltp[f"NSE:{trade['symbol']}"]["last_price"]
-        
         # Calculate P&L
         if trade['trade_type'] == "BUY":
             pnl = (current_price - trade['entry_price']) * trade['quantity']
@@ -152,153 +201,62 @@ def exit_trade(trade_id):
         db.update_trade(
             trade_id=trade_id,
             exit_price=current_price,
-            exit_time=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            exit_time=datetime.now().isoformat(sep=" ", timespec="seconds"),
             exit_reason="MANUAL",
             pnl=pnl,
             status="CLOSED"
         )
         
+        # Closed trades change the account and the daily summary
+        _fetch_account.clear()
+        _fetch_daily_summaries.clear()
+        _fetch_performance_totals.clear()
+        
         return True
     
     except Exception as e:
         st.error(f"Error exiting trade: {e}")
         return False
 
-# Dashboard page
-if page == "Dashboard":
-    st.title("Trading Dashboard")
-    
-    # Fetch account details
-    account = get_account_details()
-    
-    # Account overview
-    col1, col2, col3 = st.columns(3)
-    col1.metric("Available Cash", f"₹{account['available_cash']:,.2f}")
-    col2.metric("Used Margin", f"₹{account['used_margin']:,.2f}")
-    col3.metric("Open Positions", account['open_positions'])
-    
-    # Fetch daily summaries
-    daily_summaries = db.get_daily_summaries(days=30)
-    
-    if daily_summaries:
-        st.subheader("Performance Summary (Last 30 Days)")
-        
-        # Convert to DataFrame
-        df_summary = pd.DataFrame(daily_summaries)
-        df_summary['win_rate'] = (df_summary['winning_trades'] / df_summary['total_trades'] * 100).round(2)
-        
-        # Create metrics
-        total_pnl = df_summary['total_pnl'].sum()
-        win_rate = (df_summary['winning_trades'].sum() / df_summary['total_trades'].sum() * 100) if df_summary['total_trades'].sum() > 0 else 0
-        
-        col1, col2, col3 = st.columns(3)
-        col1.metric("Total P&L", f"₹{total_pnl:,.2f}", delta=f"{'+' if total_pnl > 0 else ''}{total_pnl:,.2f}")
-        col2.metric("Win Rate", f"{win_rate:.2f}%")
-        col3.metric("Total Trades", df_summary['total_trades'].sum())
-        
-        # P&L chart
-        st.subheader("Daily P&L")
-        fig_pnl = px.bar(
-            df_summary,
-            x='date',
-            y='total_pnl',
-            color=df_summary['total_pnl'] > 0,
-            color_discrete_map={True: 'green', False: 'red'},
-            labels={'date': 'Date', 'total_pnl': 'P&L (₹)'},
-            title="Daily Profit/Loss"
-        )
-        st.plotly_chart(fig_pnl, use_container_width=True)
-        
-        # Win rate chart
-        st.subheader("Daily Win Rate")
-        fig_win_rate = px.line(
-            df_summary,
-            x='date',
-            y='win_rate',
-            markers=True,
-            labels={'date': 'Date', 'win_rate': 'Win Rate (%)'},
-            title="Daily Win Rate"
-        )
-        fig_win_rate.update_layout(yaxis_range=[0, 100])
-        st.plotly_chart(fig_win_rate, use_container_width=True)
-    else:
-        st.info("No trade data available yet. Start trading to see performance metrics.")
-
-# Active Trades page
-elif page == "Active Trades":
-    st.title("Active Trades")
-    
+# Function to render the active trades. As a fragment it refreshes on its own
+# timer without rerunning the rest of the page; quotes come from the LTP cache.
+@st.fragment(run_every="5s")
+def render_active_trades():
     # Fetch open trades
     open_trades = db.get_open_trades()
     
     if open_trades:
-        # Convert to DataFrame
-        df_trades = pd.DataFrame(open_trades)
+        # Live columns aligned with open_trades; stay None without quotes
+        current = unrealized_pnl = dist_target = dist_sl = None
         
         # Fetch current prices if authenticated
         if kite:
             symbols = [f"NSE:{trade['symbol']}" for trade in open_trades]
             try:
-                ltp_data = kite.ltp(symbols)
+                ltp_data = _fetch_ltp(kite, tuple(sorted(set(symbols))))
                 
-                # Add current price and unrealized P&L
-                current_prices = []
-                unrealized_pnl = []
-                
-                for trade in open_trades:
-                    symbol_key = f"NSE:{trade['symbol']}"
-                    if symbol_key in ltp_data:
-                        current_price = ltp_data[symbol_key]["last_price"]
-                        
-                        if trade['trade_type'] == "BUY":
-                            pnl = (current_price - trade['entry_price']) * trade['quantity']
-                        else:
-                            pnl = (trade['entry_price'] - current_price) * trade['quantity']
-                        
-                        current_prices.append(current_price)
-                        unrealized_pnl.append(pnl)
-                    else:
-                        current_prices.append(None)
-                        unrealized_pnl.append(None)
+                # Flatten the quotes once, then one lookup per trade (NaN where no quote came back)
+                prices = {key: quote["last_price"] for key, quote in ltp_data.items()}
+                current = np.array([prices.get(key, np.nan) for key in symbols], dtype=float)
                 
-                df_trades['current_price'] = current_prices
-                df_trades['unrealized_pnl'] = unrealized_pnl
+                entry = np.array([trade['entry_price'] for trade in open_trades], dtype=float)
+                quantity = np.array([trade['quantity'] for trade in open_trades], dtype=float)
+                take_profit = np.array([trade['take_profit_price'] for trade in open_trades], dtype=float)
+                stop_loss = np.array([trade['stop_loss_price'] for trade in open_trades], dtype=float)
+                sign = np.array([trade['sign'] for trade in open_trades], dtype=float)
                 
-                # Calculate distance to target and stop loss
-                distance_to_target = []
-                distance_to_sl = []
+                # Unrealized P&L and distance to target / stop loss
+                unrealized_pnl = sign * (current - entry) * quantity
                 
-                for i, trade in enumerate(open_trades):
-                    if current_prices[i]:
-                        if trade['trade_type'] == "BUY":
-                            dist_target = ((trade['take_profit_price'] - current_prices[i]) / current_prices[i]) * 100
-                            dist_sl = ((current_prices[i] - trade['stop_loss_price']) / current_prices[i]) * 100
-                        else:
-                            dist_target = ((current_prices[i] - trade['take_profit_price']) / current_prices[i]) * 100
-                            dist_sl = ((trade['stop_loss_price'] - current_prices[i]) / current_prices[i]) * 100
-                        
-                        distance_to_target.append(f"{dist_target:.2f}%")
-                        distance_to_sl.append(f"{dist_sl:.2f}%")
-                    else:
-                        distance_to_target.append(None)
-                        distance_to_sl.append(None)
-                
-                df_trades['distance_to_target'] = distance_to_target
-                df_trades['distance_to_sl'] = distance_to_sl
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    dist_target = sign * (take_profit - current) / current * 100
+                    dist_sl = sign * (current - stop_loss) / current * 100
             
             except Exception as e:
                 st.error(f"Error fetching current prices: {e}")
         
-        # Define display columns
-        display_cols = ['symbol', 'trade_type', 'quantity', 'entry_price']
-        
-        if 'current_price' in df_trades.columns:
-            display_cols.extend(['current_price', 'unrealized_pnl', 'distance_to_target', 'distance_to_sl'])
-        
-        display_cols.extend(['take_profit_price', 'stop_loss_price', 'entry_time'])
-        
-        # Display trades table with exit buttons
-        for i, trade in df_trades.iterrows():
+        # Display trades with exit buttons
+        for idx, trade in enumerate(open_trades):
             with st.expander(f"{trade['symbol']} - {trade['trade_type']} - {trade['quantity']} shares"):
                 col1, col2 = st.columns([3, 1])
                 
@@ -312,12 +270,12 @@ elif page == "Active Trades":
                         "Entry Time": trade['entry_time']
                     }
                     
-                    if 'current_price' in df_trades.columns and trade['current_price']:
+                    if current is not None and current[idx] > 0:
                         details.update({
-                            "Current Price": f"₹{trade['current_price']:.2f}",
-                            "Unrealized P&L": f"₹{trade['unrealized_pnl']:.2f}",
-                            "Distance to Target": trade['distance_to_target'],
-                            "Distance to Stop Loss": trade['distance_to_sl']
+                            "Current Price": f"₹{current[idx]:.2f}",
+                            "Unrealized P&L": f"₹{unrealized_pnl[idx]:.2f}",
+                            "Distance to Target": f"{dist_target[idx]:.2f}%",
+                            "Distance to Stop Loss": f"{dist_sl[idx]:.2f}%"
                         })
                     
                     details.update({
@@ -331,14 +289,84 @@ elif page == "Active Trades":
                 with col2:
                     if st.button(f"Exit Trade", key=f"exit_{trade['id']}"):
                         if exit_trade(trade['id']):
-                            st.success(f"Trade {trade['symbol']} exited successfully")
-                            time.sleep(1)
-                            st.experimental_rerun()
+                            st.toast(f"Trade {trade['symbol']} exited successfully", icon="✅")
+                            st.rerun()
                         else:
                             st.error("Failed to exit trade")
     else:
         st.info("No active trades at the moment.")
 
+# Dashboard page
+if page == "Dashboard":
+    st.title("Trading Dashboard")
+    
+    # Fetch account details
+    account = get_account_details()
+    
+    # Account overview
+    cash = f"₹{account['available_cash']:,.2f}"
+    margin = f"₹{account['used_margin']:,.2f}"
+    
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Available Cash", cash)
+    col2.metric("Used Margin", margin)
+    col3.metric("Open Positions", account['open_positions'])
+    
+    # Aggregate the summary metrics in SQLite
+    total_pnl, winning_trades, total_trades = _fetch_performance_totals(30)
+    
+    if total_trades:
+        st.subheader("Performance Summary (Last 30 Days)")
+        
+        pnl = f"₹{total_pnl:,.2f}"
+        pnl_delta = f"{'+' if total_pnl > 0 else ''}{total_pnl:,.2f}"
+        win_rate = f"{winning_trades / total_trades * 100:.2f}%"
+        
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Total P&L", pnl, delta=pnl_delta)
+        col2.metric("Win Rate", win_rate)
+        col3.metric("Total Trades", total_trades)
+        
+        # Daily rows are only needed for the charts
+        df_summary = pd.DataFrame(_fetch_daily_summaries(30))
+        df_summary['win_rate'] = (df_summary['winning_trades'] / df_summary['total_trades'] * 100).round(2)
+        
+        dates = df_summary['date'].to_numpy()
+        daily_pnl = df_summary['total_pnl'].to_numpy(dtype=float)
+        
+        # P&L chart
+        st.subheader("Daily P&L")
+        fig_pnl = go.Figure(go.Bar(
+            x=dates,
+            y=daily_pnl,
+            marker_color=np.where(daily_pnl > 0, 'green', 'red')
+        ))
+        fig_pnl.update_layout(title="Daily Profit/Loss", xaxis_title="Date", yaxis_title="P&L (₹)")
+        st.plotly_chart(fig_pnl, use_container_width=True)
+        
+        # Win rate chart
+        st.subheader("Daily Win Rate")
+        fig_win_rate = go.Figure(go.Scatter(
+            x=dates,
+            y=df_summary['win_rate'].to_numpy(dtype=float),
+            mode='lines+markers'
+        ))
+        fig_win_rate.update_layout(
+            title="Daily Win Rate",
+            xaxis_title="Date",
+            yaxis_title="Win Rate (%)",
+            yaxis_range=[0, 100]
+        )
+        st.plotly_chart(fig_win_rate, use_container_width=True)
+    else:
+        st.info("No trade data available yet. Start trading to see performance metrics.")
+
+# Active Trades page
+elif page == "Active Trades":
+    st.title("Active Trades")
+    
+    render_active_trades()
+
 # Trade History page
 elif page == "Trade History":
     st.title("Trade History")
@@ -362,37 +390,19 @@ elif page == "Trade History":
         # Convert to DataFrame
         df_trades = pd.DataFrame(trades)
         
-        # Add P&L percentage
-        df_trades['pnl_pct'] = None
-        for i, trade in df_trades.iterrows():
-            if trade['exit_price'] and trade['entry_price']:
-                if trade['trade_type'] == "BUY":
-                    pnl_pct = (trade['exit_price'] - trade['entry_price']) / trade['entry_price'] * 100
-                else:
-                    pnl_pct = (trade['entry_price'] - trade['exit_price']) / trade['entry_price'] * 100
-                df_trades.at[i, 'pnl_pct'] = pnl_pct
-        
-        # Format the DataFrame for display
-        df_display = df_trades.copy()
-        
-        # Format numeric columns
-        if 'entry_price' in df_display.columns:
-            df_display['entry_price'] = df_display['entry_price'].apply(lambda x: f"₹{x:.2f}" if x else None)
+        # Add P&L percentage (NaN for trades that have not exited)
+        entry = df_trades['entry_price'].to_numpy(dtype=float)
+        exit_ = df_trades['exit_price'].to_numpy(dtype=float)
+        sign = np.where(df_trades['trade_type'].to_numpy() == "BUY", 1.0, -1.0)
         
-        if 'exit_price' in df_display.columns:
-            df_display['exit_price'] = df_display['exit_price'].apply(lambda x: f"₹{x:.2f}" if x else None)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pnl_pct = sign * (exit_ - entry) / entry * 100.0
+        df_trades['pnl_pct'] = np.where(np.isnan(exit_) | (entry == 0), np.nan, pnl_pct)
         
-        if 'take_profit_price' in df_display.columns:
-            df_display['take_profit_price'] = df_display['take_profit_price'].apply(lambda x: f"₹{x:.2f}" if x else None)
-        
-        if 'stop_loss_price' in df_display.columns:
-            df_display['stop_loss_price'] = df_display['stop_loss_price'].apply(lambda x: f"₹{x:.2f}" if x else None)
-        
-        if 'pnl' in df_display.columns:
-            df_display['pnl'] = df_display['pnl'].apply(lambda x: f"₹{x:.2f}" if x else None)
-        
-        if 'pnl_pct' in df_display.columns:
-            df_display['pnl_pct'] = df_display['pnl_pct'].apply(lambda x: f"{x:.2f}%" if x is not None else None)
+        # Keep price columns numeric; formatting happens at render time
+        price_cols = ['entry_price', 'exit_price', 'take_profit_price', 'stop_loss_price', 'pnl']
+        price_cols = [col for col in price_cols if col in df_trades.columns]
+        df_trades[price_cols] = df_trades[price_cols].astype(float)
         
         # Define display columns
         display_cols = [
@@ -401,10 +411,12 @@ elif page == "Trade History":
         ]
         
         # Keep only columns that exist in the DataFrame
-        display_cols = [col for col in display_cols if col in df_display.columns]
+        display_cols = [col for col in display_cols if col in df_trades.columns]
         
-        # Display the trades
-        st.dataframe(df_display[display_cols], use_container_width=True)
+        # Display the trades; Streamlit formats these client-side and keeps numeric sorting
+        column_config = {col: st.column_config.NumberColumn(format="₹%.2f") for col in price_cols}
+        column_config['pnl_pct'] = st.column_config.NumberColumn(format="%.2f%%")
+        st.dataframe(df_trades[display_cols], column_config=column_config, use_container_width=True)
         
         # Pagination navigation
         col1, col2, col3 = st.columns([1, 3, 1])
@@ -413,13 +425,13 @@ elif page == "Trade History":
             if page_number > 1:
                 if st.button("Previous Page"):
                     st.session_state.page_number = page_number - 1
-                    st.experimental_rerun()
+                    st.rerun()
         
         with col3:
             if page_number < total_pages:
                 if st.button("Next Page"):
                     st.session_state.page_number = page_number + 1
-                    st.experimental_rerun()
+                    st.rerun()
     else:
         st.info("No trade history available.")
 
@@ -427,40 +439,82 @@ elif page == "Trade History":
 elif page == "Settings":
     st.title("Settings")
     
+    # Widget values keyed by (section, key), written back on save
+    settings = {}
+    
     with st.expander("Strategy Settings", expanded=True):
         st.subheader("Breakout Strategy")
         
         col1, col2 = st.columns(2)
         
         with col1:
-            st.number_input("Lookback Period (Days)", min_value=5, max_value=365, value=125, step=1)
-            st.number_input("Volume Ratio Threshold", min_value=0.1, max_value=5.0, value=1.0, step=0.1)
-            st.number_input("RSI Threshold (Upper)", min_value=50, max_value=90, value=70, step=1)
+            settings[('breakout_strategy', 'lookback_days')] = st.number_input(
+                "Lookback Period (Days)", min_value=5, max_value=365, step=1,
+                value=int(config.get_value('breakout_strategy', 'lookback_days', 125)))
+            settings[('breakout_strategy', 'volume_ratio_threshold')] = st.number_input(
+                "Volume Ratio Threshold", min_value=0.1, max_value=5.0, step=0.1,
+                value=float(config.get_value('breakout_strategy', 'volume_ratio_threshold', 1.0)))
+            settings[('breakout_strategy', 'rsi_threshold')] = st.number_input(
+                "RSI Threshold (Upper)", min_value=50, max_value=90, step=1,
+                value=int(config.get_value('breakout_strategy', 'rsi_threshold', 70)))
         
         with col2:
-            st.number_input("Position Size (% of Capital)", min_value=0.01, max_value=5.0, value=0.1, step=0.01)
-            st.number_input("Take Profit (%)", min_value=0.1, max_value=20.0, value=3.0, step=0.1)
-            st.number_input("Stop Loss (%)", min_value=0.1, max_value=20.0, value=3.0, step=0.1)
+            settings[('breakout_strategy', 'position_size_pct')] = st.number_input(
+                "Position Size (% of Capital)", min_value=0.01, max_value=5.0, step=0.01,
+                value=float(config.get_value('breakout_strategy', 'position_size_pct', 0.1)))
+            settings[('breakout_strategy', 'take_profit_pct')] = st.number_input(
+                "Take Profit (%)", min_value=0.1, max_value=20.0, step=0.1,
+                value=float(config.get_value('breakout_strategy', 'take_profit_pct', 3.0)))
+            settings[('breakout_strategy', 'stop_loss_pct')] = st.number_input(
+                "Stop Loss (%)", min_value=0.1, max_value=20.0, step=0.1,
+                value=float(config.get_value('breakout_strategy', 'stop_loss_pct', 3.0)))
         
         st.subheader("Breakdown Strategy")
         
         col1, col2 = st.columns(2)
         
         with col1:
-            st.number_input("Lookback Period (Days) - Breakdown", min_value=5, max_value=365, value=125, step=1)
-            st.number_input("Volume Ratio Threshold - Breakdown", min_value=0.1, max_value=5.0, value=1.0, step=0.1)
-            st.number_input("RSI Threshold (Lower)", min_value=10, max_value=50, value=30, step=1)
+            settings[('breakdown_strategy', 'lookback_days')] = st.number_input(
+                "Lookback Period (Days) - Breakdown", min_value=5, max_value=365, step=1,
+                value=int(config.get_value('breakdown_strategy', 'lookback_days', 125)))
+            settings[('breakdown_strategy', 'volume_ratio_threshold')] = st.number_input(
+                "Volume Ratio Threshold - Breakdown", min_value=0.1, max_value=5.0, step=0.1,
+                value=float(config.get_value('breakdown_strategy', 'volume_ratio_threshold', 1.0)))
+            settings[('breakdown_strategy', 'rsi_threshold')] = st.number_input(
+                "RSI Threshold (Lower)", min_value=10, max_value=50, step=1,
+                value=int(config.get_value('breakdown_strategy', 'rsi_threshold', 30)))
         
         with col2:
-            st.number_input("Position Size (% of Capital) - Breakdown", min_value=0.01, max_value=5.0, value=1.0, step=0.01)
-            st.number_input("Take Profit (%) - Breakdown", min_value=0.1, max_value=20.0, value=3.0, step=0.1)
-            st.number_input("Stop Loss (%) - Breakdown", min_value=0.1, max_value=20.0, value=3.0, step=0.1)
+            settings[('breakdown_strategy', 'position_size_pct')] = st.number_input(
+                "Position Size (% of Capital) - Breakdown", min_value=0.01, max_value=5.0, step=0.01,
+                value=float(config.get_value('breakdown_strategy', 'position_size_pct', 1.0)))
+            settings[('breakdown_strategy', 'take_profit_pct')] = st.number_input(
+                "Take Profit (%) - Breakdown", min_value=0.1, max_value=20.0, step=0.1,
+                value=float(config.get_value('breakdown_strategy', 'take_profit_pct', 3.0)))
+            settings[('breakdown_strategy', 'stop_loss_pct')] = st.number_input(
+                "Stop Loss (%) - Breakdown", min_value=0.1, max_value=20.0, step=0.1,
+                value=float(config.get_value('breakdown_strategy', 'stop_loss_pct', 3.0)))
     
     with st.expander("General Settings"):
-        st.number_input("Maximum Active Positions", min_value=1, max_value=50, value=10, step=1)
-        st.number_input("Scan Interval (Minutes)", min_value=1, max_value=60, value=5, step=1)
-        st.checkbox("Enable Email Notifications", value=False)
-        st.checkbox("Auto-close All Positions at Market Close", value=True)
+        settings[('general', 'max_positions')] = st.number_input(
+            "Maximum Active Positions", min_value=1, max_value=50, step=1,
+            value=int(config.get_value('general', 'max_positions', 10)))
+        settings[('general', 'scan_interval_minutes')] = st.number_input(
+            "Scan Interval (Minutes)", min_value=1, max_value=60, step=1,
+            value=int(config.get_value('general', 'scan_interval_minutes', 5)))
+        settings[('general', 'enable_email_notifications')] = st.checkbox(
+            "Enable Email Notifications",
+            value=bool(config.get_value('general', 'enable_email_notifications', False)))
+        settings[('general', 'auto_close_at_market_close')] = st.checkbox(
+            "Auto-close All Positions at Market Close",
+            value=bool(config.get_value('general', 'auto_close_at_market_close', True)))
     
     if st.button("Save Settings"):
-        st.success("Settings saved successfully!")
+        # Buffer every change in memory, then write config.json once
+        for (section, key), value in settings.items():
+            config.update_config(section, key, value)
+        
+        if config.flush():
+            st.success("Settings saved successfully!")
+        else:
+            st.error("Failed to save settings")
@@ -1,18 +1,156 @@
 # database.py
 import sqlite3
 import logging
+import threading
+from contextlib import contextmanager, nullcontext
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# Statements on the trading hot paths, kept as module constants so every call
+# passes the same SQL text and hits the connection's prepared-statement cache
+_INSERT_TRADE_SQL = '''
+INSERT INTO trades (
+    id, kite_order_id, symbol, trade_type, quantity, 
+    entry_price, take_profit_price, stop_loss_price, 
+    status, entry_time
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+_INCREMENT_TRADE_COUNT_SQL = "UPDATE meta SET value = value + 1 WHERE key = 'trade_count'"
+
+_SELECT_TRADE_STATUS_SQL = 'SELECT status FROM trades WHERE id = ?'
+
+_UPDATE_TRADE_SQL = '''
+UPDATE trades
+SET exit_price = ?, exit_time = ?, exit_reason = ?, pnl = ?, status = ?
+WHERE id = ?
+'''
+
+_ADD_TO_DAILY_SUMMARY_SQL = '''
+INSERT INTO daily_summary (date, total_trades, winning_trades, losing_trades, total_pnl)
+VALUES (?, 1, ?, ?, ?)
+ON CONFLICT(date) DO UPDATE SET
+    total_trades = total_trades + 1,
+    winning_trades = winning_trades + excluded.winning_trades,
+    losing_trades = losing_trades + excluded.losing_trades,
+    total_pnl = total_pnl + excluded.total_pnl
+'''
+
+# sign is +1 for BUY and -1 for SELL so callers can compute P&L without branching
+_SELECT_OPEN_TRADES_SQL = '''
+SELECT id, symbol, trade_type, quantity, entry_price,
+       take_profit_price, stop_loss_price, entry_time,
+       CASE WHEN trade_type = 'BUY' THEN 1 ELSE -1 END AS sign
+FROM trades
+WHERE status = 'OPEN'
+'''
+
+_SELECT_LATEST_BARS_SQL = '''
+SELECT date, close, volume
+FROM bars
+WHERE token = ?
+ORDER BY date DESC
+LIMIT ?
+'''
+
+_UPSERT_BAR_SQL = '''
+INSERT INTO bars (token, date, open, high, low, close, volume)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(token, date) DO UPDATE SET
+    open = excluded.open,
+    high = excluded.high,
+    low = excluded.low,
+    close = excluded.close,
+    volume = excluded.volume
+'''
+
+_DELETE_OLD_BARS_SQL = 'DELETE FROM bars WHERE token = ? AND date < ?'
+
+_DELETE_BARS_SQL = 'DELETE FROM bars WHERE token = ?'
+
+_SELECT_BARS_SQL = '''
+SELECT date, open, high, low, close, volume
+FROM bars
+WHERE token = ? AND date >= ?
+ORDER BY date
+'''
+
 class Database:
-    def __init__(self, db_path):
+    def __init__(self, db_path, shared=False):
         self.db_path = db_path
+        # One connection per thread, reused across calls. With shared=True every
+        # thread uses a single connection instead, for hosts such as Streamlit
+        # that run each rerun on a new thread; write transactions then take
+        # turns on it under _write_lock.
+        self._pool = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._shared = shared
+        self._shared_conn = None
+        self._write_lock = threading.RLock()
         self.init_db()
     
+    def _connect(self):
+        """Open and tune a new database connection"""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, cached_statements=256)
+        conn.row_factory = sqlite3.Row
+        
+        # Per-connection tuning; WAL makes synchronous=NORMAL safe against corruption
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute('PRAGMA mmap_size=268435456')
+        conn.execute('PRAGMA cache_size=-65536')
+        return conn
+    
     def get_connection(self):
-        """Get a database connection"""
-        return sqlite3.connect(self.db_path)
+        """Get this thread's pooled database connection, or the shared one"""
+        if self._shared:
+            with self._lock:
+                if self._shared_conn is None:
+                    self._shared_conn = self._connect()
+                return self._shared_conn
+        
+        conn = getattr(self._pool, 'conn', None)
+        if conn is not None:
+            return conn
+        
+        conn = self._connect()
+        self._pool.conn = conn
+        
+        with self._lock:
+            # Close connections left behind by threads that have exited
+            for thread, stale in self._connections:
+                if not thread.is_alive():
+                    stale.close()
+            self._connections = [(t, c) for t, c in self._connections if t.is_alive()]
+            self._connections.append((threading.current_thread(), conn))
+        
+        return conn
+    
+    def close_all(self):
+        """Close every pooled connection"""
+        with self._lock:
+            for _, conn in self._connections:
+                conn.close()
+            self._connections = []
+            if self._shared_conn is not None:
+                self._shared_conn.close()
+                self._shared_conn = None
+        self._pool.conn = None
+    
+    @contextmanager
+    def _transaction(self):
+        """Run a block as one write transaction on this thread's connection"""
+        with self._write_lock if self._shared else nullcontext():
+            conn = self.get_connection()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn.cursor()
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
     
     def init_db(self):
         """Initialize the database schema"""
@@ -20,6 +158,12 @@ class Database:
             conn = self.get_connection()
             cursor = conn.cursor()
             
+            # WAL lets dashboard reads run alongside the trader's writes; it is
+            # persistent, so setting it once here covers every later connection
+            journal_mode = cursor.execute('PRAGMA journal_mode=WAL').fetchone()[0]
+            if journal_mode.lower() != 'wal':
+                logger.warning(f"Could not enable WAL journal mode, using {journal_mode}")
+            
             # Create trades table
             cursor.execute('''
             CREATE TABLE IF NOT EXISTS trades (
@@ -36,10 +180,25 @@ class Database:
                 exit_time TEXT,
                 exit_reason TEXT,
                 pnl REAL,
-                status TEXT
+                status TEXT,
+                exit_date TEXT GENERATED ALWAYS AS (substr(exit_time, 1, 10)) STORED
             )
             ''')
             
+            # Databases created before exit_date existed get it as a VIRTUAL
+            # column, since ALTER TABLE cannot add STORED ones; both are indexable
+            columns = [row['name'] for row in cursor.execute('PRAGMA table_xinfo(trades)')]
+            if 'exit_date' not in columns:
+                cursor.execute('''
+                ALTER TABLE trades
+                ADD COLUMN exit_date TEXT GENERATED ALWAYS AS (substr(exit_time, 1, 10)) VIRTUAL
+                ''')
+            
+            # Indexes for the open-trade scan, history ordering and per-day summaries
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_trades_status ON trades(status)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_trades_entry_time_desc ON trades(entry_time DESC)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_trades_exit_date_status ON trades(exit_date, status)')
+            
             # Create daily_summary table
             cursor.execute('''
             CREATE TABLE IF NOT EXISTS daily_summary (
@@ -51,8 +210,32 @@ class Database:
             )
             ''')
             
-            conn.commit()
-            conn.close()
+            # Running counters kept alongside the data so reads avoid full scans;
+            # trade_count is seeded once from databases that predate the table
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value INTEGER
+            )
+            ''')
+            cursor.execute('''
+            INSERT OR IGNORE INTO meta (key, value)
+            SELECT 'trade_count', COUNT(*) FROM trades
+            ''')
+            
+            # Local copy of daily bars so scans only fetch the days they are missing
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS bars (
+                token INTEGER,
+                date TEXT,
+                open REAL,
+                high REAL,
+                low REAL,
+                close REAL,
+                volume INTEGER,
+                PRIMARY KEY (token, date)
+            ) WITHOUT ROWID
+            ''')
             
             logger.info("Database initialized successfully")
         
@@ -62,25 +245,16 @@ class Database:
     
     def insert_trade(self, order_id, kite_order_id, symbol, trade_type, quantity, 
                      entry_price, take_profit_price, stop_loss_price, status, entry_time):
-        """Insert a new trade into the database"""
+        """Insert a new trade and bump the trade counter in a single transaction"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-            INSERT INTO trades (
-                id, kite_order_id, symbol, trade_type, quantity, 
-                entry_price, take_profit_price, stop_loss_price, 
-                status, entry_time
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                order_id, kite_order_id, symbol, trade_type, quantity,
-                entry_price, take_profit_price, stop_loss_price,
-                status, entry_time
-            ))
-            
-            conn.commit()
-            conn.close()
+            with self._transaction() as cursor:
+                cursor.execute(_INSERT_TRADE_SQL, (
+                    order_id, kite_order_id, symbol, trade_type, quantity,
+                    entry_price, take_profit_price, stop_loss_price,
+                    status, entry_time
+                ))
+                
+                cursor.execute(_INCREMENT_TRADE_COUNT_SQL)
             
             logger.info(f"Trade {order_id} inserted successfully")
             return True
@@ -90,25 +264,21 @@ class Database:
             return False
     
     def update_trade(self, trade_id, exit_price, exit_time, exit_reason, pnl, status):
-        """Update a trade in the database"""
+        """Update a trade and today's summary in a single transaction"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-            UPDATE trades
-            SET exit_price = ?, exit_time = ?, exit_reason = ?, pnl = ?, status = ?
-            WHERE id = ?
-            ''', (exit_price, exit_time, exit_reason, pnl, status, trade_id))
+            today = datetime.now().strftime("%Y-%m-%d")
             
-            conn.commit()
-            conn.close()
+            with self._transaction() as cursor:
+                cursor.execute(_SELECT_TRADE_STATUS_SQL, (trade_id,))
+                previous = cursor.fetchone()
+                
+                cursor.execute(_UPDATE_TRADE_SQL, (exit_price, exit_time, exit_reason, pnl, status, trade_id))
+                
+                # Fold the trade into today's summary the first time it closes
+                if status == "CLOSED" and previous and previous['status'] != "CLOSED":
+                    self._add_to_daily_summary_txn(cursor, today, pnl)
             
             logger.info(f"Trade {trade_id} updated successfully")
-            
-            # Update daily summary
-            self.update_daily_summary()
-            
             return True
         
         except Exception as e:
@@ -119,14 +289,11 @@ class Database:
         """Get a trade by ID"""
         try:
             conn = self.get_connection()
-            conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
             cursor.execute('SELECT * FROM trades WHERE id = ?', (trade_id,))
             trade = cursor.fetchone()
             
-            conn.close()
-            
             if trade:
                 return dict(trade)
             else:
@@ -140,14 +307,11 @@ class Database:
         """Get all open trades"""
         try:
             conn = self.get_connection()
-            conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
-            cursor.execute('SELECT * FROM trades WHERE status = "OPEN"')
+            cursor.execute(_SELECT_OPEN_TRADES_SQL)
             trades = cursor.fetchall()
             
-            conn.close()
-            
             return [dict(trade) for trade in trades]
         
         except Exception as e:
@@ -158,7 +322,6 @@ class Database:
         """Get all trades with pagination"""
         try:
             conn = self.get_connection()
-            conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -169,11 +332,10 @@ class Database:
             
             trades = cursor.fetchall()
             
-            # Get total count
-            cursor.execute('SELECT COUNT(*) FROM trades')
-            total = cursor.fetchone()[0]
-            
-            conn.close()
+            # Get total count from the counter maintained by insert_trade
+            cursor.execute("SELECT value FROM meta WHERE key = 'trade_count'")
+            row = cursor.fetchone()
+            total = row[0] if row else 0
             
             return {
                 'trades': [dict(trade) for trade in trades],
@@ -185,62 +347,135 @@ class Database:
             return {'trades': [], 'total': 0}
     
     def update_daily_summary(self):
-        """Update the daily summary table"""
+        """Rebuild today's summary row from the trades table"""
         try:
             today = datetime.now().strftime("%Y-%m-%d")
             
+            with self._transaction() as cursor:
+                self._update_daily_summary_txn(cursor, today)
+            
+            logger.info(f"Daily summary for {today} updated successfully")
+            return True
+        
+        except Exception as e:
+            logger.error(f"Error updating daily summary: {e}")
+            return False
+    
+    def _add_to_daily_summary_txn(self, cursor, today, pnl):
+        """Add one closed trade to today's summary inside the caller's transaction"""
+        win = 1 if pnl > 0 else 0
+        
+        cursor.execute(_ADD_TO_DAILY_SUMMARY_SQL, (today, win, 1 - win, pnl))
+    
+    def _update_daily_summary_txn(self, cursor, today):
+        """Recompute today's summary row from the trades table inside the caller's transaction"""
+        cursor.execute('''
+        SELECT COUNT(*) as total,
+               SUM(CASE WHEN pnl > 0 THEN 1 ELSE 0 END) as winning,
+               SUM(CASE WHEN pnl <= 0 THEN 1 ELSE 0 END) as losing,
+               SUM(pnl) as total_pnl
+        FROM trades
+        WHERE exit_date = ? AND status = 'CLOSED'
+        ''', (today,))
+        
+        result = cursor.fetchone()
+        
+        if result and result[0] > 0:
+            cursor.execute('''
+            INSERT INTO daily_summary (date, total_trades, winning_trades, losing_trades, total_pnl)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(date) DO UPDATE SET
+                total_trades = excluded.total_trades,
+                winning_trades = excluded.winning_trades,
+                losing_trades = excluded.losing_trades,
+                total_pnl = excluded.total_pnl
+            ''', (today, *result))
+    
+    def get_latest_bars(self, token, count):
+        """Get the date, close and volume of an instrument's latest stored bars, newest first"""
+        try:
             conn = self.get_connection()
             cursor = conn.cursor()
             
-            # Get today's closed trades
-            cursor.execute('''
-            SELECT COUNT(*) as total,
-                   SUM(CASE WHEN pnl > 0 THEN 1 ELSE 0 END) as winning,
-                   SUM(CASE WHEN pnl <= 0 THEN 1 ELSE 0 END) as losing,
-                   SUM(pnl) as total_pnl
-            FROM trades
-            WHERE date(exit_time) = ? AND status = "CLOSED"
-            ''', (today,))
-            
-            result = cursor.fetchone()
-            
-            if result and result[0] > 0:
-                total_trades, winning_trades, losing_trades, total_pnl = result
-                
-                # Check if today's summary exists
-                cursor.execute('SELECT 1 FROM daily_summary WHERE date = ?', (today,))
-                exists = cursor.fetchone()
-                
-                if exists:
-                    # Update existing summary
-                    cursor.execute('''
-                    UPDATE daily_summary
-                    SET total_trades = ?, winning_trades = ?, losing_trades = ?, total_pnl = ?
-                    WHERE date = ?
-                    ''', (total_trades, winning_trades, losing_trades, total_pnl, today))
-                else:
-                    # Insert new summary
-                    cursor.execute('''
-                    INSERT INTO daily_summary (date, total_trades, winning_trades, losing_trades, total_pnl)
-                    VALUES (?, ?, ?, ?, ?)
-                    ''', (today, total_trades, winning_trades, losing_trades, total_pnl))
-                
-                conn.commit()
+            cursor.execute(_SELECT_LATEST_BARS_SQL, (token, count))
+            
+            return [dict(bar) for bar in cursor.fetchall()]
+        
+        except Exception as e:
+            logger.error(f"Error getting latest bars for {token}: {e}")
+            return []
+    
+    def delete_bars(self, token):
+        """Delete every stored bar of an instrument"""
+        try:
+            with self._transaction() as cursor:
+                cursor.execute(_DELETE_BARS_SQL, (token,))
+            
+            return True
+        
+        except Exception as e:
+            logger.error(f"Error deleting bars for {token}: {e}")
+            return False
+    
+    def save_bars(self, token, bars, keep_from=None):
+        """
+        Store daily bars for an instrument in a single transaction, replacing days already stored
+        
+        Parameters:
+        token (int): instrument token
+        bars (list): daily bars as returned by Kite's historical data API
+        keep_from (str): if given, bars before this "YYYY-MM-DD" date are deleted
+        """
+        try:
+            rows = [
+                (token, bar['date'].strftime("%Y-%m-%d"), bar['open'],
+                 bar['high'], bar['low'], bar['close'], bar['volume'])
+                for bar in bars
+            ]
             
-            conn.close()
+            with self._transaction() as cursor:
+                cursor.executemany(_UPSERT_BAR_SQL, rows)
+                if keep_from is not None:
+                    cursor.execute(_DELETE_OLD_BARS_SQL, (token, keep_from))
             
-            logger.info(f"Daily summary for {today} updated successfully")
             return True
         
         except Exception as e:
-            logger.error(f"Error updating daily summary: {e}")
+            logger.error(f"Error saving bars for {token}: {e}")
+            return False
+    
+    def get_bars(self, token, from_date):
+        """Get an instrument's stored daily bars from a date onwards, oldest first"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            
+            cursor.execute(_SELECT_BARS_SQL, (token, from_date))
+            
+            return [dict(bar) for bar in cursor.fetchall()]
+        
+        except Exception as e:
+            logger.error(f"Error getting bars for {token}: {e}")
+            return []
+    
+    def checkpoint(self):
+        """Fold the WAL back into the database file and refresh query planner stats"""
+        try:
+            conn = self.get_connection()
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            conn.execute('PRAGMA optimize')
+            
+            logger.info("Database checkpoint completed")
+            return True
+        
+        except Exception as e:
+            logger.error(f"Error running database checkpoint: {e}")
             return False
     
     def get_daily_summaries(self, days=30):
         """Get daily summaries for the last N days"""
         try:
             conn = self.get_connection()
-            conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -251,10 +486,33 @@ class Database:
             ''', (days,))
             
             summaries = cursor.fetchall()
-            conn.close()
             
             return [dict(summary) for summary in summaries]
         
         except Exception as e:
             logger.error(f"Error getting daily summaries: {e}")
             return []
+    
+    def get_performance_totals(self, days=30):
+        """Get total P&L, winning trades and total trades over the last N daily summaries"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+            SELECT COALESCE(SUM(total_pnl), 0),
+                   COALESCE(SUM(winning_trades), 0),
+                   COALESCE(SUM(total_trades), 0)
+            FROM (
+                SELECT total_pnl, winning_trades, total_trades
+                FROM daily_summary
+                ORDER BY date DESC
+                LIMIT ?
+            )
+            ''', (days,))
+            
+            return tuple(cursor.fetchone())
+        
+        except Exception as e:
+            logger.error(f"Error getting performance totals: {e}")
+            return (0, 0, 0)
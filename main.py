@@ -1,16 +1,17 @@
 # main.py
-import os
-import time
+import sys
+import signal
 import logging
 import threading
-from datetime import datetime, time as datetime_time
+import subprocess
+from datetime import datetime
 import pandas as pd
 import streamlit as st
 from apscheduler.schedulers.background import BackgroundScheduler
 from kiteconnect import KiteConnect
 
-from scanner import StockScanner
-from trader import Trader
+from scanner import StockScanner, HISTORY_WORKERS
+from trader import Trader, ORDER_WORKERS
 from database import Database
 
 # Configure logging
@@ -24,7 +25,15 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Seconds between polled take-profit/stop-loss checks; the price stream exits
+# most trades sooner, this covers trades it does not follow
+EXIT_CHECK_SECONDS = 30
+
 class TradingApp:
+    # NSE trading session (09:15 to 15:30) as seconds since midnight
+    MARKET_OPEN_SECONDS = 9 * 3600 + 15 * 60
+    MARKET_CLOSE_SECONDS = 15 * 3600 + 30 * 60
+    
     def __init__(self, api_key, api_secret, access_token=None):
         self.api_key = api_key
         self.api_secret = api_secret
@@ -35,11 +44,21 @@ class TradingApp:
         self.db = Database('trades.db')
         self.scheduler = BackgroundScheduler()
         self.is_market_open = False
+        self.dashboard_process = None
+        self.stop_event = threading.Event()
         self.initialize_kite()
         
     def initialize_kite(self):
         """Initialize Kite Connect API"""
-        self.kite = KiteConnect(api_key=self.api_key)
+        # Size the HTTP connection pool for the scanner's history workers plus
+        # the trader's order workers, which can run at the same time when a
+        # tick exits a trade mid-scan; a smaller pool would drop and
+        # re-handshake connections
+        pool_size = HISTORY_WORKERS + ORDER_WORKERS
+        self.kite = KiteConnect(
+            api_key=self.api_key,
+            pool={"pool_connections": pool_size, "pool_maxsize": pool_size}
+        )
         
         if not self.access_token:
             # Generate a request token URL
@@ -59,18 +78,22 @@ class TradingApp:
         self.kite.set_access_token(self.access_token)
         
         # Initialize scanner and trader
-        self.scanner = StockScanner(self.kite)
+        self.scanner = StockScanner(self.kite, self.db)
         self.trader = Trader(self.kite, self.db)
+        # Trades loaded from the database need their tokens to join the price stream
+        self.trader.set_instrument_tokens(
+            {instrument['tradingsymbol']: instrument['instrument_token'] for instrument in self.scanner.instruments}
+        )
+        self.trader.start_ticker(self.api_key, self.access_token)
         
         logger.info("Kite Connect API initialized successfully")
     
     def check_market_status(self):
         """Check if the market is open"""
-        now = datetime.now().time()
-        market_open = datetime_time(9, 15)
-        market_close = datetime_time(15, 30)
+        now = datetime.now()
+        seconds = now.hour * 3600 + now.minute * 60 + now.second
         
-        if market_open <= now <= market_close and datetime.now().weekday() < 5:
+        if self.MARKET_OPEN_SECONDS <= seconds <= self.MARKET_CLOSE_SECONDS and now.weekday() < 5:
             if not self.is_market_open:
                 logger.info("Market is open")
                 self.is_market_open = True
@@ -87,15 +110,17 @@ class TradingApp:
             logger.info("Market is closed. Skipping scan.")
             return
         
+        # Each tick scans fresh data; within the tick the result is shared
+        self.scanner.clear_scan_cache()
+        
         try:
             # Get available funds and open positions
-            profile = self.kite.profile()
             margins = self.kite.margins()
             available_cash = margins["equity"]["available"]["cash"]
             positions = self.kite.positions()["net"]
             
             # Count open positions
-            open_positions_count = len([p for p in positions if p["quantity"] != 0])
+            open_positions_count = sum(1 for p in positions if p["quantity"])
             
             logger.info(f"Available cash: {available_cash}")
             logger.info(f"Open positions: {open_positions_count}")
@@ -105,15 +130,13 @@ class TradingApp:
                 logger.info("Maximum positions (10) reached. Not taking new trades.")
                 return
             
-            # Scan for breakout stocks
-            logger.info("Scanning for breakout opportunities...")
-            breakout_stocks = self.scanner.scan_for_breakouts()
+            # Scan for breakout and breakdown stocks in a single pass
+            logger.info("Scanning for breakout and breakdown opportunities...")
+            breakout_stocks, breakdown_stocks = self.scanner.scan()
             
-            # Scan for breakdown stocks
-            logger.info("Scanning for breakdown opportunities...")
-            breakdown_stocks = self.scanner.scan_for_breakdowns()
+            # Collect trades based on scanner results, then place them together
+            orders = []
             
-            # Execute trades based on scanner results
             if breakout_stocks and open_positions_count < 10:
                 # Calculate position size (0.1% of available funds)
                 position_size = available_cash * 0.001
@@ -123,14 +146,15 @@ class TradingApp:
                         break
                     
                     logger.info(f"Executing BUY trade for {stock['symbol']}")
-                    self.trader.execute_trade(
+                    orders.append(dict(
                         symbol=stock['symbol'],
                         trade_type="BUY",
                         quantity=int(position_size / stock['close']),
                         price=stock['close'],
                         take_profit_pct=3.0,
-                        stop_loss_pct=3.0
-                    )
+                        stop_loss_pct=3.0,
+                        instrument_token=stock['token']
+                    ))
                     open_positions_count += 1
             
             if breakdown_stocks and open_positions_count < 10:
@@ -142,50 +166,94 @@ class TradingApp:
                         break
                     
                     logger.info(f"Executing SELL trade for {stock['symbol']}")
-                    self.trader.execute_trade(
+                    orders.append(dict(
                         symbol=stock['symbol'],
                         trade_type="SELL",
                         quantity=int(position_size / stock['close']),
                         price=stock['close'],
                         take_profit_pct=3.0,
-                        stop_loss_pct=3.0
-                    )
+                        stop_loss_pct=3.0,
+                        instrument_token=stock['token']
+                    ))
                     open_positions_count += 1
             
-            # Check for target/stoploss hits
-            self.trader.check_exit_conditions()
+            self.trader.execute_trades(orders)
             
         except Exception as e:
             logger.error(f"Error in scan_and_trade: {e}")
     
+    def check_exits(self):
+        """Check open trades for target/stoploss hits, independently of the slower scan"""
+        if not self.check_market_status():
+            return
+        
+        try:
+            self.trader.check_exit_conditions()
+        except Exception as e:
+            logger.error(f"Error in check_exits: {e}")
+    
     def start(self):
         """Start the trading app"""
         logger.info("Starting trading application")
         
-        # Schedule the scan to run every 5 minutes
-        self.scheduler.add_job(self.scan_and_trade, 'interval', minutes=5)
+        # Schedule the scan to run every 5 minutes; ticks missed while a slow
+        # scan is still running collapse into one run instead of queueing up.
+        # History requests are limited to HISTORY_RATE per second, so a scan of
+        # the ~2,000 NSE equities takes about 11 minutes and in practice starts
+        # every 15 minutes, on the first tick after the previous scan finishes.
+        self.scheduler.add_job(self.scan_and_trade, 'interval', minutes=5, max_instances=1, coalesce=True)
+        
+        # Exits are checked on their own job so they never wait behind a scan
+        self.scheduler.add_job(self.check_exits, 'interval', seconds=EXIT_CHECK_SECONDS, max_instances=1, coalesce=True)
+        
+        # Keep the SQLite WAL from growing unbounded
+        self.scheduler.add_job(self.db.checkpoint, 'interval', minutes=15)
         self.scheduler.start()
         
+        # Shut down cleanly on SIGTERM as well, so in-flight orders finish
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        
         try:
             # Run the Streamlit dashboard in a separate thread
             dashboard_thread = threading.Thread(target=self.run_dashboard)
             dashboard_thread.daemon = True
             dashboard_thread.start()
             
-            # Keep the main thread alive
-            while True:
-                time.sleep(1)
+            # Keep the main thread alive without waking it until shutdown
+            self.stop_event.wait()
         except (KeyboardInterrupt, SystemExit):
             self.stop()
     
     def run_dashboard(self):
-        """Run the Streamlit dashboard"""
-        os.system("streamlit run dashboard.py")
+        """Run the Streamlit dashboard and forward its output to the log"""
+        try:
+            self.dashboard_process = subprocess.Popen(
+                ["streamlit", "run", "dashboard.py"],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True
+            )
+            
+            # Reading the pipe keeps streamlit from blocking once its buffer fills
+            for line in self.dashboard_process.stdout:
+                logger.info(f"dashboard: {line.rstrip()}")
+            
+            logger.info(f"Dashboard exited with code {self.dashboard_process.wait()}")
+        except Exception as e:
+            logger.error(f"Error running dashboard: {e}")
     
     def stop(self):
         """Stop the trading app"""
         logger.info("Stopping trading application")
+        self.stop_event.set()
+        # A scan takes minutes at the history rate limit; cut it short so the
+        # scheduler shutdown below only waits for requests already in flight
+        self.scanner.stop()
         self.scheduler.shutdown()
+        self.trader.close()
+        if self.dashboard_process and self.dashboard_process.poll() is None:
+            self.dashboard_process.terminate()
+        self.db.close_all()
 
 
 # Usage example
@@ -0,0 +1,34 @@
+# ratelimit.py
+import time
+import threading
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilling at rate tokens per second, holding at most burst"""
+    
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def _refill(self):
+        """Add the tokens earned since the last call; the caller holds the lock"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+    
+    def acquire(self):
+        """Take a token, sleeping until one is available"""
+        while True:
+            with self._lock:
+                self._refill()
+                
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                
+                wait = (1 - self.tokens) / self.rate
+            
+            time.sleep(wait)
@@ -1,40 +1,102 @@
 # scanner.py
+import os
+import glob
+import json
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+
+from ratelimit import TokenBucket
 
 logger = logging.getLogger(__name__)
 
+# On-disk instrument list, one file per trading day
+INSTRUMENTS_CACHE = "instruments_nse_{date}.json"
+
+# Historical-data requests allowed per second, and how many may go out back
+# to back; Kite's historical endpoint accepts about three requests per second
+HISTORY_RATE = 3.0
+HISTORY_BURST = 1
+
+# Concurrent historical-data requests; enough to keep the rate limit busy
+# while earlier requests are still waiting on the network
+HISTORY_WORKERS = 4
+
+# Days of history behind the high/low and volume-average signals
+LOOKBACK_BARS = 125
+
+# Calendar days of history fetched and kept for LOOKBACK_BARS + 1 trading
+# sessions; NSE trades 5 days a week less up to 10 holidays in half a year,
+# so 1.6 calendar days per session leaves a few sessions to spare
+HISTORY_DAYS = (LOOKBACK_BARS + 1) * 8 // 5
+
+
 class StockScanner:
-    def __init__(self, kite):
+    def __init__(self, kite, db=None):
         self.kite = kite
+        # Optional Database used to keep daily bars between scans
+        self.db = db
         self.instruments = None
+        # Result of the current tick's scan, reused until clear_scan_cache()
+        self._scan_result = None
+        # Shared by every history worker so the fan-out stays within Kite's limit
+        self._history_bucket = TokenBucket(rate=HISTORY_RATE, burst=HISTORY_BURST)
+        # Set by stop() so a running scan skips its remaining fetches
+        self._stopped = threading.Event()
         self.load_instruments()
     
     def load_instruments(self):
-        """Load all NSE equity instruments"""
+        """Load all NSE equity instruments, cached on disk for the trading day"""
+        cache_path = INSTRUMENTS_CACHE.format(date=datetime.now().strftime("%Y%m%d"))
+        
+        if os.path.exists(cache_path):
+            try:
+                with open(cache_path) as f:
+                    self.instruments = json.load(f)
+                logger.info(f"Loaded {len(self.instruments)} equity instruments from {cache_path}")
+                return
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable instrument cache {cache_path}: {e}")
+        
         try:
-            self.instruments = self.kite.instruments("NSE")
+            df = pd.DataFrame(self.kite.instruments("NSE"))
             # Filter for only equity instruments
-            self.instruments = [i for i in self.instruments if i['segment'] == 'NSE' and i['instrument_type'] == 'EQ']
+            df = df[(df['segment'] == 'NSE') & (df['instrument_type'] == 'EQ')].reset_index(drop=True)
+            self.instruments = df.to_dict('records')
             logger.info(f"Loaded {len(self.instruments)} equity instruments")
         except Exception as e:
             logger.error(f"Error loading instruments: {e}")
             raise
+        
+        self.save_instrument_cache(cache_path)
     
-    def get_historical_data(self, instrument_token, days=130):
+    def save_instrument_cache(self, cache_path):
+        """Write today's instrument list to disk and drop caches from earlier days"""
+        try:
+            # Plain scalars only; the expiry is a date (or empty for equities)
+            with open(cache_path, 'w') as f:
+                json.dump(self.instruments, f, default=str)
+            for old_path in glob.glob(INSTRUMENTS_CACHE.format(date="*")):
+                if old_path != cache_path:
+                    os.remove(old_path)
+        except Exception as e:
+            logger.warning(f"Could not write instrument cache {cache_path}: {e}")
+    
+    def get_historical_data(self, instrument_token, days=HISTORY_DAYS):
         """Get historical data for a given instrument token"""
         try:
             to_date = datetime.now().date()
             from_date = to_date - timedelta(days=days)
             
-            data = self.kite.historical_data(
-                instrument_token=instrument_token,
-                from_date=from_date,
-                to_date=to_date,
-                interval="day"
-            )
+            if self.db is not None:
+                df = self.get_stored_history(instrument_token, from_date, to_date)
+                if df is not None:
+                    return df
+            
+            data = self.fetch_history(instrument_token, from_date, to_date)
             
             df = pd.DataFrame(data)
             if df.empty:
@@ -45,35 +107,215 @@ class StockScanner:
             logger.error(f"Error fetching historical data for {instrument_token}: {e}")
             return None
     
+    def get_stored_history(self, instrument_token, from_date, to_date):
+        """
+        Get historical data from the local bar store, fetching only the missing days from Kite.
+        
+        Fetching starts at the second-to-last stored day: the latest stored bar
+        may have been stored during market hours and still be incomplete, while
+        the one before it is final. If Kite now returns a different close or
+        volume for that day, its candles were back-adjusted for a split or bonus
+        issue, so the stored bars are dropped and the whole window is reloaded.
+        Returns None if the bars could not be stored, so the caller can fall
+        back to a full fetch.
+        """
+        latest = self.db.get_latest_bars(instrument_token, 2)
+        check = latest[1] if len(latest) == 2 and date.fromisoformat(latest[1]['date']) >= from_date else None
+        fetch_from = date.fromisoformat(check['date']) if check else from_date
+        
+        data = self.fetch_history(instrument_token, fetch_from, to_date)
+        
+        if check is not None:
+            fetched = next((bar for bar in data if bar['date'].strftime("%Y-%m-%d") == check['date']), None)
+            if fetched is None or fetched['close'] != check['close'] or fetched['volume'] != check['volume']:
+                logger.info(f"Reloading adjusted history for {instrument_token}")
+                if not self.db.delete_bars(instrument_token):
+                    return None
+                data = self.fetch_history(instrument_token, from_date, to_date)
+        
+        # Bars older than the window are never read again, so they are dropped
+        if not self.db.save_bars(instrument_token, data, keep_from=from_date.isoformat()):
+            return None
+        
+        df = pd.DataFrame(self.db.get_bars(instrument_token, from_date.isoformat()))
+        if df.empty:
+            return None
+        
+        return df
+    
+    def fetch_history(self, instrument_token, from_date, to_date):
+        """Fetch daily bars from Kite, waiting for the shared history rate limit"""
+        self._history_bucket.acquire()
+        return self.kite.historical_data(
+            instrument_token=instrument_token,
+            from_date=from_date,
+            to_date=to_date,
+            interval="day"
+        )
+    
+    def get_instrument_history(self, instrument):
+        """Get historical data for an instrument, tagged with its token and symbol"""
+        if self._stopped.is_set():
+            return None
+        
+        df = self.get_historical_data(instrument['instrument_token'])
+        if df is None:
+            return None
+        
+        return df.assign(token=instrument['instrument_token'], symbol=instrument['tradingsymbol'])
+    
     def calculate_indicators(self, df):
-        """Calculate technical indicators on a dataframe"""
-        if df is None or df.empty or len(df) < 125:
+        """
+        Calculate the latest technical indicators for every symbol in a combined dataframe.
+        
+        Rows must be grouped by token in date order. Only the values needed for
+        today's signal are computed, so the result has one row per symbol with
+        its latest close and volume. Symbols with fewer than 126 bars (125
+        previous days plus today) are dropped, as are symbols closing inside
+        their 125-day range, since neither can pass the breakout or breakdown scan.
+        """
+        if df is None or df.empty:
             return None
         
         try:
-            # Calculate highest high and lowest low of last 125 days
-            df['125d_high'] = df['high'].rolling(window=125).max().shift(1)
-            df['125d_low'] = df['low'].rolling(window=125).min().shift(1)
+            df = df[df.groupby('token')['close'].transform('size') >= LOOKBACK_BARS + 1].reset_index(drop=True)
+            if df.empty:
+                return None
             
-            # Calculate 125-day SMA of volume
-            df['volume_sma_125'] = df['volume'].rolling(window=125).mean()
+            grouped = df.groupby('token', sort=False)
+            position = grouped.cumcount().to_numpy()
+            from_end = grouped.cumcount(ascending=False).to_numpy()
+            group_ids = grouped.ngroup().to_numpy()
             
-            # Calculate 14-day RSI
-            delta = df['close'].diff()
-            gain = delta.where(delta > 0, 0)
-            loss = -delta.where(delta < 0, 0)
+            # The last 126 bars of each symbol, one symbol per row. Prices stay
+            # float64 since they are compared exactly and used as order prices;
+            # the volume average and RSI are approximate and fine in float32
+            window = from_end <= LOOKBACK_BARS
+            high = df['high'].to_numpy()[window].reshape(-1, LOOKBACK_BARS + 1)
+            low = df['low'].to_numpy()[window].reshape(-1, LOOKBACK_BARS + 1)
+            volume = df['volume'].to_numpy(dtype=np.float32)[window].reshape(-1, LOOKBACK_BARS + 1)
             
-            avg_gain = gain.rolling(window=14).mean()
-            avg_loss = loss.rolling(window=14).mean()
+            latest = df.loc[from_end == 0, ['token', 'symbol', 'close', 'volume']].reset_index(drop=True).assign(**{
+                # Highest high and lowest low of the previous 125 days
+                '125d_high': high[:, :-1].max(axis=1),
+                '125d_low': low[:, :-1].min(axis=1),
+                # 125-day SMA of volume, including today
+                'volume_sma_125': volume[:, 1:].mean(axis=1)
+            })
             
-            rs = avg_gain / avg_loss
-            df['rsi_14'] = 100 - (100 / (1 + rs))
+            # Only a close outside the 125-day range can pass either scan, so
+            # the RSI is computed for those symbols alone
+            outside = ((latest['close'] > latest['125d_high']) | (latest['close'] < latest['125d_low'])).to_numpy()
+            rows = outside[group_ids]
             
-            return df
+            # Calculate 14-day RSI with Wilder's smoothing (an EMA with alpha = 1/14).
+            # The first bar of each symbol has no previous close, so its change is 0.
+            close = df['close'].to_numpy(dtype=np.float32)
+            delta = np.diff(close, prepend=np.float32(np.nan))[rows]
+            delta[position[rows] == 0] = 0
+            
+            gain = np.maximum(delta, 0)
+            loss = np.maximum(-delta, 0)
+            
+            # Only the last value of y[t] = (1 - a) * y[t-1] + a * x[t], y[0] = x[0]
+            # is needed, which is a weighted sum of each symbol's bars
+            alpha = np.float32(1 / 14)
+            decay = (1 - alpha) ** from_end[rows].astype(np.float32)
+            weights = np.where(position[rows] == 0, decay, alpha * decay)
+            
+            avg_gain = np.bincount(group_ids[rows], weights=weights * gain, minlength=len(latest))[outside]
+            avg_loss = np.bincount(group_ids[rows], weights=weights * loss, minlength=len(latest))[outside]
+            
+            with np.errstate(divide='ignore', invalid='ignore'):
+                rs = avg_gain / avg_loss
+            
+            return latest[outside].reset_index(drop=True).assign(rsi_14=100 - (100 / (1 + rs)))
         except Exception as e:
             logger.error(f"Error calculating indicators: {e}")
             return None
     
+    def scan(self):
+        """
+        Scan for both strategies, reusing this tick's result if there is one.
+        
+        Call clear_scan_cache() at the start of each tick so the next call
+        scans fresh data.
+        
+        Returns:
+        tuple: (breakout_stocks, breakdown_stocks), each sorted by volume ratio
+        """
+        if self._scan_result is None:
+            self._scan_result = self.run_scan()
+        return self._scan_result
+    
+    def clear_scan_cache(self):
+        """Forget the cached scan result so the next scan() fetches fresh data"""
+        self._scan_result = None
+    
+    def stop(self):
+        """Make a running scan skip its remaining history fetches and return no candidates"""
+        self._stopped.set()
+    
+    def run_scan(self):
+        """
+        Scan every instrument once for both strategies.
+        
+        Historical data is fetched in parallel, indicators are computed in one
+        pass over all symbols, and the latest bar of each symbol is checked
+        against the breakout and breakdown conditions.
+        
+        Returns:
+        tuple: (breakout_stocks, breakdown_stocks), each sorted by volume ratio
+        """
+        with ThreadPoolExecutor(max_workers=HISTORY_WORKERS) as pool:
+            frames = [df for df in pool.map(self.get_instrument_history, self.instruments) if df is not None]
+        
+        # A scan cut short by stop() has only some symbols, so it finds nothing
+        if self._stopped.is_set():
+            logger.info("Scan stopped before all history was fetched")
+            return [], []
+        
+        df = self.calculate_indicators(pd.concat(frames, ignore_index=True)) if frames else None
+        
+        if df is None:
+            logger.info("No instruments with enough history to scan")
+            return [], []
+        
+        # Breakout: close above the 125-day high on above-average volume, RSI < 70
+        breakouts = df[
+            (df['close'] > df['125d_high']) &
+            (df['volume'] > df['volume_sma_125']) &
+            (df['rsi_14'] < 70)
+        ].assign(volume_ratio=lambda d: d['volume'] / d['volume_sma_125'])
+        
+        # Breakdown: close below the 125-day low on below-average volume, RSI > 30.
+        # A high ratio here means volume is much lower than average.
+        breakdowns = df[
+            (df['close'] < df['125d_low']) &
+            (df['volume'] < df['volume_sma_125']) &
+            (df['rsi_14'] > 30)
+        ].assign(volume_ratio=lambda d: d['volume_sma_125'] / d['volume'])
+        
+        breakout_stocks = self.to_candidates(breakouts, "Breakout")
+        breakdown_stocks = self.to_candidates(breakdowns, "Breakdown")
+        
+        logger.info(f"Found {len(breakout_stocks)} breakout candidates")
+        logger.info(f"Found {len(breakdown_stocks)} breakdown candidates")
+        return breakout_stocks, breakdown_stocks
+    
+    def to_candidates(self, hits, kind):
+        """Convert matching rows to candidate dicts, sorted by volume ratio (highest first)"""
+        hits = hits.sort_values('volume_ratio', ascending=False, kind='stable')
+        
+        candidates = hits.rename(columns={'rsi_14': 'rsi'})[
+            ['symbol', 'token', 'close', 'volume', 'rsi', 'volume_ratio']
+        ].to_dict('records')
+        
+        for hit in candidates:
+            logger.info(f"{kind} detected: {hit['symbol']} - Close: {hit['close']}, RSI: {hit['rsi']:.2f}")
+        
+        return candidates
+    
     def scan_for_breakouts(self):
         """
         Scan for stocks breaking out to new highs with the following conditions:
@@ -81,48 +323,7 @@ class StockScanner:
         2. Today's volume > 125-day SMA of volume
         3. 14-day RSI < 70 (not overbought)
         """
-        breakout_stocks = []
-        
-        for instrument in self.instruments:
-            try:
-                symbol = instrument['tradingsymbol']
-                token = instrument['instrument_token']
-                
-                df = self.get_historical_data(token)
-                df = self.calculate_indicators(df)
-                
-                if df is None or df.empty:
-                    continue
-                
-                # Get the latest row
-                latest = df.iloc[-1]
-                
-                # Check breakout conditions
-                if (latest['close'] > latest['125d_high'] and 
-                    latest['volume'] > latest['volume_sma_125'] and 
-                    latest['rsi_14'] < 70):
-                    
-                    breakout_stocks.append({
-                        'symbol': symbol,
-                        'token': token,
-                        'close': latest['close'],
-                        'volume': latest['volume'],
-                        'rsi': latest['rsi_14'],
-                        'volume_ratio': latest['volume'] / latest['volume_sma_125']
-                    })
-                    
-                    logger.info(f"Breakout detected: {symbol} - Close: {latest['close']}, RSI: {latest['rsi_14']:.2f}")
-            
-            except Exception as e:
-                logger.error(f"Error scanning {instrument['tradingsymbol']}: {e}")
-                continue
-        
-        # Sort by volume ratio (highest first)
-        if breakout_stocks:
-            breakout_stocks = sorted(breakout_stocks, key=lambda x: x['volume_ratio'], reverse=True)
-        
-        logger.info(f"Found {len(breakout_stocks)} breakout candidates")
-        return breakout_stocks
+        return self.scan()[0]
     
     def scan_for_breakdowns(self):
         """
@@ -131,45 +332,4 @@ class StockScanner:
         2. Today's volume < 125-day SMA of volume
         3. 14-day RSI > 30 (not oversold)
         """
-        breakdown_stocks = []
-        
-        for instrument in self.instruments:
-            try:
-                symbol = instrument['tradingsymbol']
-                token = instrument['instrument_token']
-                
-                df = self.get_historical_data(token)
-                df = self.calculate_indicators(df)
-                
-                if df is None or df.empty:
-                    continue
-                
-                # Get the latest row
-                latest = df.iloc[-1]
-                
-                # Check breakdown conditions
-                if (latest['close'] < latest['125d_low'] and 
-                    latest['volume'] < latest['volume_sma_125'] and 
-                    latest['rsi_14'] > 30):
-                    
-                    breakdown_stocks.append({
-                        'symbol': symbol,
-                        'token': token,
-                        'close': latest['close'],
-                        'volume': latest['volume'],
-                        'rsi': latest['rsi_14'],
-                        'volume_ratio': latest['volume_sma_125'] / latest['volume']
-                    })
-                    
-                    logger.info(f"Breakdown detected: {symbol} - Close: {latest['close']}, RSI: {latest['rsi_14']:.2f}")
-            
-            except Exception as e:
-                logger.error(f"Error scanning {instrument['tradingsymbol']}: {e}")
-                continue
-        
-        # Sort by volume ratio (highest first - means volume is much lower than average)
-        if breakdown_stocks:
-            breakdown_stocks = sorted(breakdown_stocks, key=lambda x: x['volume_ratio'], reverse=True)
-        
-        logger.info(f"Found {len(breakdown_stocks)} breakdown candidates")
-        return breakdown_stocks
+        return self.scan()[1]
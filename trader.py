@@ -1,16 +1,268 @@
 # trader.py
+import time
 import logging
-import uuid
-from datetime import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import numpy as np
+import requests
+from kiteconnect import KiteTicker
+from kiteconnect.exceptions import KiteException
+from twisted.internet import reactor
+
+try:
+    from numba import njit
+except ImportError:  # optional, the numpy sweep is used instead
+    njit = None
+
+from ratelimit import TokenBucket
 
 logger = logging.getLogger(__name__)
 
+# Orders placed at once; Kite allows about 10 order requests per second
+ORDER_WORKERS = 8
+
+# Quote requests allowed per second, and how many may go out back to back;
+# Kite's quote endpoints accept about one request per second
+LTP_RATE = 1.0
+LTP_BURST = 1
+
+# Seconds ticks wait before retrying a failed exit order, doubling after each
+# further failure up to the maximum; polling still retries on its own schedule
+EXIT_RETRY_DELAY = 1.0
+EXIT_RETRY_MAX = 60.0
+
+def _now_str():
+    """Current local time in the database's "YYYY-MM-DD HH:MM:SS" format"""
+    t = time.localtime()
+    return "%04d-%02d-%02d %02d:%02d:%02d" % (t.tm_year, t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec)
+
+# Failures from a broker call: Kite's API errors, and network errors from the
+# requests session underneath it
+BROKER_ERRORS = (KiteException, requests.RequestException)
+
+# Exit reasons from the take-profit/stop-loss sweep
+NO_EXIT, TARGET_HIT, STOPLOSS_HIT = 0, 1, 2
+
+def _sweep_loop(sign, take_profit, stop_loss, current, reasons):
+    """Fill reasons with each trade's exit reason; take profit wins if both are hit"""
+    for i in range(current.shape[0]):
+        if sign[i] * (current[i] - take_profit[i]) >= 0:
+            reasons[i] = TARGET_HIT
+        elif sign[i] * (stop_loss[i] - current[i]) >= 0:
+            reasons[i] = STOPLOSS_HIT
+
+if njit is not None:
+    # Compiled eagerly for the float64/int8 arrays _sweep passes, so the first
+    # stop-loss check does not pay the JIT cost
+    _sweep_loop = njit("void(f8[:], f8[:], f8[:], f8[:], i1[:])", cache=True)(_sweep_loop)
+
+def _sweep(sign, take_profit, stop_loss, current):
+    """Exit reason for every trade, compiled with numba when it is installed"""
+    reasons = np.zeros(current.shape[0], dtype=np.int8)
+    
+    if njit is not None:
+        _sweep_loop(sign, take_profit, stop_loss, current, reasons)
+    else:
+        reasons[sign * (stop_loss - current) >= 0] = STOPLOSS_HIT
+        reasons[sign * (current - take_profit) >= 0] = TARGET_HIT
+    
+    return reasons
+
+def _log_exit_error(future):
+    """Log an error raised by an exit that was started from the price stream"""
+    error = future.exception()
+    if error is not None:
+        logger.error("Error exiting trade from tick: %s", error)
+
+@dataclass(slots=True)
+class OpenTrade:
+    """An open position tracked in memory between its entry and exit orders"""
+    id: str
+    symbol: str
+    kite_symbol: str
+    trade_type: str
+    quantity: int
+    entry_price: float
+    take_profit_price: float
+    stop_loss_price: float
+    is_buy: bool
+    # Set on entry, or by set_instrument_tokens() for trades loaded from the
+    # database; without it the trade is checked by polling instead of the price stream
+    instrument_token: int = None
+    
+    @classmethod
+    def from_row(cls, row):
+        """Build an open trade from a trades table row"""
+        return cls(
+            id=row['id'],
+            symbol=row['symbol'],
+            kite_symbol=f"NSE:{row['symbol']}",
+            trade_type=row['trade_type'],
+            quantity=row['quantity'],
+            entry_price=row['entry_price'],
+            take_profit_price=row['take_profit_price'],
+            stop_loss_price=row['stop_loss_price'],
+            is_buy=row['trade_type'] == "BUY"
+        )
+    
+    @property
+    def sign(self):
+        """+1 for BUY and -1 for SELL trades"""
+        return 1 if self.is_buy else -1
+
 class Trader:
     def __init__(self, kite, db):
         self.kite = kite
         self.db = db
+        # Order parameters that are the same for every order: intraday market
+        # orders on NSE, valid for the day
+        self._order_defaults = dict(
+            variety=kite.VARIETY_REGULAR,
+            exchange=kite.EXCHANGE_NSE,
+            product=kite.PRODUCT_MIS,
+            order_type=kite.ORDER_TYPE_MARKET,
+            price=None,
+            validity=kite.VALIDITY_DAY
+        )
+        # Order calls are network-bound, so several run side by side
+        self._pool = ThreadPoolExecutor(max_workers=ORDER_WORKERS, thread_name_prefix="order")
+        self._ltp_bucket = TokenBucket(rate=LTP_RATE, burst=LTP_BURST)
+        
+        # Open trades by ID, kept in step with every entry and exit so checks
+        # do not re-read them from the database; loaded once at startup
+        self._lock = threading.RLock()
+        self._open_trades = {row['id']: OpenTrade.from_row(row) for row in db.get_open_trades()}
+        # IDs of trades with an exit order in flight, so ticks and polling never exit one twice
+        self._exiting = set()
+        # Trades whose last exit order failed, as (retry time on the monotonic
+        # clock, current delay), so ticks do not resend it on every price update
+        self._exit_backoff = {}
+        
+        # Kite WebSocket price stream, started by start_ticker()
+        self._ticker = None
+    
+    def close(self):
+        """Stop the price stream and wait for in-flight orders"""
+        # The ticker belongs to the twisted reactor thread
+        if self._ticker is not None:
+            reactor.callFromThread(self._ticker.close)
+        self._pool.shutdown(wait=True)
+    
+    def _get_ltp_batch(self, symbols):
+        """
+        Get last-traded prices for several symbols in one quote request
+        
+        Parameters:
+        symbols (list): Kite symbols such as "NSE:INFY"
+        
+        Returns:
+        dict: last-traded price for every symbol Kite returned a quote for
+        """
+        return {symbol: quote["last_price"] for symbol, quote in self.kite.ltp(symbols).items()}
+    
+    def set_instrument_tokens(self, tokens):
+        """Fill in instrument tokens, by trading symbol, for open trades loaded without one"""
+        with self._lock:
+            for trade in self._open_trades.values():
+                if trade.instrument_token is None:
+                    trade.instrument_token = tokens.get(trade.symbol)
+    
+    def start_ticker(self, api_key, access_token):
+        """Stream last-traded prices for open trades over Kite's WebSocket and exit on each tick"""
+        self._ticker = KiteTicker(api_key, access_token)
+        self._ticker.on_connect = self._on_ticker_connect
+        self._ticker.on_ticks = self._on_ticks
+        self._ticker.connect(threaded=True)
+    
+    def _on_ticker_connect(self, ws, response):
+        """Subscribe to every open trade with a known instrument token"""
+        with self._lock:
+            tokens = list({trade.instrument_token for trade in self._open_trades.values()
+                           if trade.instrument_token is not None})
+        
+        if tokens:
+            ws.subscribe(tokens)
+            ws.set_mode(ws.MODE_LTP, tokens)
+    
+    def _watch(self, instrument_token):
+        """Add an instrument to the price stream; the ticker resubscribes it after reconnects"""
+        if self._ticker is None or instrument_token is None or not self._ticker.is_connected():
+            return
+        
+        # The ticker belongs to the twisted reactor thread
+        reactor.callFromThread(self._ticker.subscribe, [instrument_token])
+        reactor.callFromThread(self._ticker.set_mode, self._ticker.MODE_LTP, [instrument_token])
+    
+    def _unwatch(self, instrument_token):
+        """Drop an instrument from the price stream once no open trade needs it"""
+        if self._ticker is None or instrument_token is None or not self._ticker.is_connected():
+            return
+        
+        with self._lock:
+            if any(trade.instrument_token == instrument_token for trade in self._open_trades.values()):
+                return
+        
+        reactor.callFromThread(self._ticker.unsubscribe, [instrument_token])
+    
+    def _on_ticks(self, ws, ticks):
+        """Check ticked trades for take profit or stop loss, leaving the orders to the workers"""
+        prices = {tick['instrument_token']: tick['last_price'] for tick in ticks}
+        now = time.monotonic()
+        
+        with self._lock:
+            ticked = [trade for trade in self._open_trades.values()
+                      if trade.instrument_token in prices and trade.id not in self._exiting
+                      and self._exit_backoff.get(trade.id, (now,))[0] <= now]
+        
+        if not ticked:
+            return
+        
+        current = np.array([prices[trade.instrument_token] for trade in ticked], dtype=float)
+        reasons = _sweep(
+            np.array([trade.sign for trade in ticked], dtype=float),
+            np.array([trade.take_profit_price for trade in ticked], dtype=float),
+            np.array([trade.stop_loss_price for trade in ticked], dtype=float),
+            current
+        )
+        
+        # Exits are placed on the order workers so the socket thread keeps reading ticks
+        for i in np.flatnonzero(reasons):
+            trade = ticked[i]
+            current_price = float(current[i])
+            
+            if reasons[i] == TARGET_HIT:
+                logger.info("Take profit hit for %s at %s", trade.symbol, current_price)
+                exit_reason = "TARGET"
+            else:
+                logger.info("Stop loss hit for %s at %s", trade.symbol, current_price)
+                exit_reason = "STOPLOSS"
+            
+            # Ticks can still arrive while close() is stopping the ticker
+            try:
+                future = self._pool.submit(self.exit_trade, trade.id, exit_reason, current_price=current_price)
+            except RuntimeError:
+                logger.info("Trader is closing, ignoring tick for %s", trade.symbol)
+                return
+            
+            # Nothing waits on these exits, so surface their errors here
+            future.add_done_callback(_log_exit_error)
+    
+    def execute_trades(self, orders):
+        """
+        Execute several trades concurrently
+        
+        Parameters:
+        orders (list): Keyword arguments for execute_trade, one dict per trade
+        
+        Returns:
+        list: execute_trade's result for each order, in the same order
+        """
+        futures = [self._pool.submit(self.execute_trade, **order) for order in orders]
+        return [future.result() for future in futures]
     
-    def execute_trade(self, symbol, trade_type, quantity, price, take_profit_pct, stop_loss_pct):
+    def execute_trade(self, symbol, trade_type, quantity, price, take_profit_pct, stop_loss_pct,
+                      instrument_token=None):
         """
         Execute a trade and save it to the database
         
@@ -21,168 +273,232 @@ class Trader:
         price (float): Current price
         take_profit_pct (float): Take profit percentage
         stop_loss_pct (float): Stop loss percentage
+        instrument_token (int): Kite instrument token, used to follow the trade on the price stream
         """
-        try:
-            # Calculate take profit and stop loss prices
-            if trade_type == "BUY":
-                take_profit_price = price * (1 + take_profit_pct / 100)
-                stop_loss_price = price * (1 - stop_loss_pct / 100)
-            else:  # SELL
-                take_profit_price = price * (1 - take_profit_pct / 100)
-                stop_loss_price = price * (1 + stop_loss_pct / 100)
-            
-            # Generate unique order ID
-            order_id = str(uuid.uuid4())
-            
-            # Place order with Zerodha
-            try:
-                kite_order = self.kite.place_order(
-                    variety=self.kite.VARIETY_REGULAR,
-                    exchange=self.kite.EXCHANGE_NSE,
-                    tradingsymbol=symbol,
-                    transaction_type=trade_type,
-                    quantity=quantity,
-                    product=self.kite.PRODUCT_MIS,  # Intraday
-                    order_type=self.kite.ORDER_TYPE_MARKET,
-                    price=None,  # Market order
-                    validity=self.kite.VALIDITY_DAY
-                )
-                
-                logger.info(f"Order placed successfully. Order ID: {kite_order}")
-                
-                # Save trade info to database
-                self.db.insert_trade(
-                    order_id=order_id,
-                    kite_order_id=kite_order,
-                    symbol=symbol,
-                    trade_type=trade_type,
-                    quantity=quantity,
-                    entry_price=price,
-                    take_profit_price=take_profit_price,
-                    stop_loss_price=stop_loss_price,
-                    status="OPEN",
-                    entry_time=datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                )
-                
-                return True
-            
-            except Exception as e:
-                logger.error(f"Error placing order: {e}")
-                return False
+        # Calculate take profit and stop loss prices
+        if trade_type == "BUY":
+            take_profit_price = price * (1 + take_profit_pct / 100)
+            stop_loss_price = price * (1 - stop_loss_pct / 100)
+        else:  # SELL
+            take_profit_price = price * (1 - take_profit_pct / 100)
+            stop_loss_price = price * (1 + stop_loss_pct / 100)
         
-        except Exception as e:
-            logger.error(f"Error in execute_trade: {e}")
+        # Place order with Zerodha
+        try:
+            kite_order = self.kite.place_order(
+                **self._order_defaults,
+                tradingsymbol=symbol,
+                transaction_type=trade_type,
+                quantity=quantity
+            )
+        except BROKER_ERRORS as e:
+            logger.error("Error placing order: %s", e)
             return False
+        
+        logger.info("Order placed successfully. Order ID: %s", kite_order)
+        
+        # Save the trade row before returning, since a filled order that is never
+        # stored is never tracked or exited after a restart; Kite's order ID is
+        # unique per order, so it doubles as the trade ID
+        self.db.insert_trade(
+            order_id=kite_order,
+            kite_order_id=kite_order,
+            symbol=symbol,
+            trade_type=trade_type,
+            quantity=quantity,
+            entry_price=price,
+            take_profit_price=take_profit_price,
+            stop_loss_price=stop_loss_price,
+            status="OPEN",
+            entry_time=_now_str()
+        )
+        
+        with self._lock:
+            self._open_trades[kite_order] = OpenTrade(
+                id=kite_order,
+                symbol=symbol,
+                kite_symbol=f"NSE:{symbol}",
+                trade_type=trade_type,
+                quantity=quantity,
+                entry_price=price,
+                take_profit_price=take_profit_price,
+                stop_loss_price=stop_loss_price,
+                is_buy=trade_type == "BUY",
+                instrument_token=instrument_token
+            )
+        
+        self._watch(instrument_token)
+        return True
     
-    def exit_trade(self, trade_id, exit_reason):
+    def exit_trade(self, trade_id, exit_reason, current_price=None):
         """
         Exit a trade
         
         Parameters:
         trade_id (str): Trade ID
         exit_reason (str): Reason for exiting (TARGET, STOPLOSS, MANUAL)
+        current_price (float): Price used for P&L; fetched from Kite if not given
         """
-        try:
-            # Get trade info from database
-            trade = self.db.get_trade(trade_id)
-            
-            if not trade:
-                logger.error(f"Trade {trade_id} not found")
-                return False
-            
-            if trade['status'] != "OPEN":
-                logger.warning(f"Trade {trade_id} is already {trade['status']}")
+        # Ticks and polling can both spot the same hit; only one exit order goes
+        # out, and once it has the trade is no longer open for _exit_trade
+        with self._lock:
+            if trade_id in self._exiting:
+                logger.info("Trade %s already has an exit order in flight", trade_id)
                 return False
-            
-            # Determine exit transaction type (opposite of entry)
-            exit_type = "SELL" if trade['trade_type'] == "BUY" else "BUY"
-            
-            # Place exit order
+            self._exiting.add(trade_id)
+        
+        try:
+            return self._exit_trade(trade_id, exit_reason, current_price)
+        finally:
+            with self._lock:
+                self._exiting.discard(trade_id)
+    
+    def _exit_trade(self, trade_id, exit_reason, current_price):
+        """Exit a trade while holding its in-flight marker"""
+        # Only this process opens trades and every open one is loaded at startup,
+        # so a trade missing here is closed
+        with self._lock:
+            trade = self._open_trades.get(trade_id)
+        
+        if trade is None:
+            logger.warning("Trade %s is not open", trade_id)
+            return False
+        
+        # The dashboard can close trades too, so the stored status has the final say
+        stored = self.db.get_trade(trade_id)
+        
+        if stored and stored['status'] != "OPEN":
+            logger.warning("Trade %s is already %s", trade_id, stored['status'])
+            with self._lock:
+                self._open_trades.pop(trade_id, None)
+                self._exit_backoff.pop(trade_id, None)
+            return False
+        
+        # Get the current price for calculating P&L, unless the caller already
+        # has it from a batched quote. This happens before the order so a failed
+        # quote never leaves an exit order without its database update.
+        if current_price is None:
             try:
-                kite_order = self.kite.place_order(
-                    variety=self.kite.VARIETY_REGULAR,
-                    exchange=self.kite.EXCHANGE_NSE,
-                    tradingsymbol=trade['symbol'],
-                    transaction_type=exit_type,
-                    quantity=trade['quantity'],
-                    product=self.kite.PRODUCT_MIS,  # Intraday
-                    order_type=self.kite.ORDER_TYPE_MARKET,
-                    price=None,  # Market order
-                    validity=self.kite.VALIDITY_DAY
-                )
-                
-                logger.info(f"Exit order placed successfully. Order ID: {kite_order}")
-                
-                # Get the current price for calculating P&L
-                ltp = self.kite.ltp(f"NSE:{trade['symbol']}")
-                current_price = ltp[f"NSE:{trade['symbol']}"]["last_price"]
-                
-                # Calculate P&L
-                if trade['trade_type'] == "BUY":
-                    pnl = (current_price - trade['entry_price']) * trade['quantity']
-                else:  # SELL
-                    pnl = (trade['entry_price'] - current_price) * trade['quantity']
-                
-                # Update trade in database
-                self.db.update_trade(
-                    trade_id=trade_id,
-                    exit_price=current_price,
-                    exit_time=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    exit_reason=exit_reason,
-                    pnl=pnl,
-                    status="CLOSED"
-                )
-                
-                return True
+                current_price = self._get_ltp_batch([trade.kite_symbol]).get(trade.kite_symbol)
+            except BROKER_ERRORS as e:
+                logger.error("Error getting price for %s: %s", trade.kite_symbol, e)
+                return False
             
-            except Exception as e:
-                logger.error(f"Error placing exit order: {e}")
+            if current_price is None:
+                logger.error("No price data for %s", trade.kite_symbol)
                 return False
         
-        except Exception as e:
-            logger.error(f"Error in exit_trade: {e}")
+        # Determine exit transaction type (opposite of entry)
+        exit_type = "SELL" if trade.is_buy else "BUY"
+        
+        # Place exit order
+        try:
+            kite_order = self.kite.place_order(
+                **self._order_defaults,
+                tradingsymbol=trade.symbol,
+                transaction_type=exit_type,
+                quantity=trade.quantity
+            )
+        except BROKER_ERRORS as e:
+            logger.error("Error placing exit order: %s", e)
+            self._delay_exit(trade_id)
             return False
+        
+        logger.info("Exit order placed successfully. Order ID: %s", kite_order)
+        
+        # Calculate P&L
+        if trade.is_buy:
+            pnl = (current_price - trade.entry_price) * trade.quantity
+        else:  # SELL
+            pnl = (trade.entry_price - current_price) * trade.quantity
+        
+        # Save the exit before returning, since a trade still stored as OPEN is
+        # reloaded and exited a second time after a restart
+        self.db.update_trade(
+            trade_id=trade_id,
+            exit_price=current_price,
+            exit_time=_now_str(),
+            exit_reason=exit_reason,
+            pnl=pnl,
+            status="CLOSED"
+        )
+        
+        with self._lock:
+            self._open_trades.pop(trade_id, None)
+            self._exit_backoff.pop(trade_id, None)
+        
+        self._unwatch(trade.instrument_token)
+        return True
+    
+    def _delay_exit(self, trade_id):
+        """Hold tick-driven exits of a trade back after a failed exit order, doubling the wait each time"""
+        with self._lock:
+            previous = self._exit_backoff.get(trade_id)
+            delay = EXIT_RETRY_DELAY if previous is None else min(previous[1] * 2, EXIT_RETRY_MAX)
+            self._exit_backoff[trade_id] = (time.monotonic() + delay, delay)
+        
+        logger.info("Retrying exit of %s from ticks in %.0f s", trade_id, delay)
     
     def check_exit_conditions(self):
         """Check if any open trades have hit their take profit or stop loss"""
+        # Nothing to do on idle ticks before the first position is opened
+        if not self._open_trades:
+            return
+        
+        # Get open trades that are not already being exited
+        with self._lock:
+            open_trades = [trade for trade in self._open_trades.values() if trade.id not in self._exiting]
+        
+        if not open_trades:
+            return
+        
+        # Wait for the quote rate limit rather than skip the check; the next
+        # poll could be too late for a stop loss
+        self._ltp_bucket.acquire()
+        
+        # Get current prices
+        symbols = [trade.kite_symbol for trade in open_trades]
         try:
-            # Get all open trades
-            open_trades = self.db.get_open_trades()
-            
-            if not open_trades:
-                return
+            prices = self._get_ltp_batch(symbols)
+        except BROKER_ERRORS as e:
+            logger.error("Error getting prices for exit check: %s", e)
+            return
+        
+        priced = []
+        current = []
+        for trade in open_trades:
+            price = prices.get(trade.kite_symbol)
+            if price is None:
+                logger.warning("No price data for %s", trade.kite_symbol)
+                continue
+            priced.append(trade)
+            current.append(price)
+        
+        if not priced:
+            return
+        
+        # Check every trade for take profit or stop loss hit in one pass;
+        # sign is -1 for SELL trades, so one comparison covers both directions
+        current = np.array(current, dtype=float)
+        sign = np.array([trade.sign for trade in priced], dtype=float)
+        take_profit = np.array([trade.take_profit_price for trade in priced], dtype=float)
+        stop_loss = np.array([trade.stop_loss_price for trade in priced], dtype=float)
+        
+        reasons = _sweep(sign, take_profit, stop_loss, current)
+        
+        # Send every exit order at once and wait for them together
+        exits = []
+        for i in np.flatnonzero(reasons):
+            trade = priced[i]
+            current_price = float(current[i])
             
-            # Get current prices
-            symbols = [f"NSE:{trade['symbol']}" for trade in open_trades]
-            ltp_data = self.kite.ltp(symbols)
+            if reasons[i] == TARGET_HIT:
+                logger.info("Take profit hit for %s at %s", trade.symbol, current_price)
+                exits.append(self._pool.submit(self.exit_trade, trade.id, "TARGET", current_price=current_price))
             
-            for trade in open_trades:
-                symbol_key = f"NSE:{trade['symbol']}"
-                
-                if symbol_key not in ltp_data:
-                    logger.warning(f"No price data for {symbol_key}")
-                    continue
-                
-                current_price = ltp_data[symbol_key]["last_price"]
-                
-                # Check for take profit or stop loss hit
-                if trade['trade_type'] == "BUY":
-                    if current_price >= trade['take_profit_price']:
-                        logger.info(f"Take profit hit for {trade['symbol']} at {current_price}")
-                        self.exit_trade(trade['id'], "TARGET")
-                    
-                    elif current_price <= trade['stop_loss_price']:
-                        logger.info(f"Stop loss hit for {trade['symbol']} at {current_price}")
-                        self.exit_trade(trade['id'], "STOPLOSS")
-                
-                else:  # SELL
-                    if current_price <= trade['take_profit_price']:
-                        logger.info(f"Take profit hit for {trade['symbol']} at {current_price}")
-                        self.exit_trade(trade['id'], "TARGET")
-                    
-                    elif current_price >= trade['stop_loss_price']:
-                        logger.info(f"Stop loss hit for {trade['symbol']} at {current_price}")
-                        self.exit_trade(trade['id'], "STOPLOSS")
-        
-        except Exception as e:
-            logger.error(f"Error in check_exit_conditions: {e}")
+            else:
+                logger.info("Stop loss hit for %s at %s", trade.symbol, current_price)
+                exits.append(self._pool.submit(self.exit_trade, trade.id, "STOPLOSS", current_price=current_price))
+        
+        for future in exits:
+            future.result()